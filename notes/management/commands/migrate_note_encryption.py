@@ -37,7 +37,7 @@ class Command(BaseCommand):
     def decrypt_old_format(self, note, password):
         """Decrypt note using old format (both title and content encrypted)"""
         try:
-            salt = str(note.user.id).encode().ljust(16, b"0")[:16]
+            salt = str(note.user_id).encode().ljust(16, b"0")[:16]
             key = self.derive_key(password, salt)
             fernet = Fernet(key)
 
@@ -51,7 +51,7 @@ class Command(BaseCommand):
 
     def encrypt_new_format(self, note, password, decrypted_title, decrypted_content):
         """Encrypt note using new format (only content encrypted)"""
-        salt = str(note.user.id).encode().ljust(16, b"0")[:16]
+        salt = str(note.user_id).encode().ljust(16, b"0")[:16]
         key = self.derive_key(password, salt)
         fernet = Fernet(key)
 
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-15 22:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0008_canvaselement_deleted_canvaselement_deleted_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['user', '-updated_at'], name='note_user_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-15 22:30
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0009_note_user_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(models.F('user'), django.db.models.functions.text.Lower('name'), name='tag_user_name_lower_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-15 22:38
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_content_hash(apps, schema_editor):
+    NoteVersion = apps.get_model("notes", "NoteVersion")
+    batch = []
+    for version in NoteVersion.objects.only("id", "content").iterator(chunk_size=500):
+        version.content_hash = hashlib.blake2b(
+            version.content.encode(), digest_size=16
+        ).hexdigest()
+        batch.append(version)
+        if len(batch) >= 500:
+            NoteVersion.objects.bulk_update(batch, ["content_hash"])
+            batch = []
+    if batch:
+        NoteVersion.objects.bulk_update(batch, ["content_hash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0010_tag_user_name_lower_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="noteversion",
+            name="content_hash",
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+        migrations.RunPython(fill_content_hash, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="noteversion",
+            index=models.Index(
+                fields=["note", "-created_at"], name="version_note_created_idx"
+            ),
+        ),
+    ]
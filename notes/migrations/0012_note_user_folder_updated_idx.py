@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-15 22:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0011_noteversion_content_hash"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="note",
+            index=models.Index(
+                fields=["user", "folder", "-updated_at"],
+                name="note_user_folder_updated_idx",
+            ),
+        ),
+    ]
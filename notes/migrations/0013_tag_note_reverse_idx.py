@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-15 22:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0012_note_user_folder_updated_idx"),
+    ]
+
+    # The implicit M2M through tables only get a unique (note_id, tag_id) index
+    # and single-column FK indexes. Tag filtering walks them from the tag side,
+    # so add (tag_id, note_id) to resolve note ids straight from the index.
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX notes_note_tags_tag_note_idx "
+            "ON notes_note_tags (tag_id, note_id);",
+            "DROP INDEX notes_note_tags_tag_note_idx;",
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX notes_sharednote_tags_tag_note_idx "
+            "ON notes_sharednote_tags (tag_id, sharednote_id);",
+            "DROP INDEX notes_sharednote_tags_tag_note_idx;",
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-15 22:45
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def rename_colliding_shared_folders(apps, schema_editor):
+    # Swapping a reversed folder can collide on unique_together with an
+    # in-order folder of the same pair, name and parent; give those a numbered
+    # name first, as 0015 does for root folders
+    SharedFolder = apps.get_model("notes", "SharedFolder")
+    reversed_folders = SharedFolder.objects.filter(
+        user1__gt=F("user2"), parent__isnull=False
+    ).order_by("id")
+    for folder in reversed_folders:
+        pair = {folder.user1_id, folder.user2_id}
+        siblings = SharedFolder.objects.filter(
+            user1__in=pair, user2__in=pair, parent_id=folder.parent_id
+        ).exclude(pk=folder.pk)
+        if not siblings.filter(user1=folder.user2_id, name=folder.name).exists():
+            continue
+        taken = set(siblings.values_list("name", flat=True))
+        name, n = folder.name, 1
+        while name in taken:
+            n += 1
+            name = f"{folder.name[:90]} ({n})"
+        folder.name = name
+        folder.save(update_fields=["name"])
+
+
+def order_shared_pairs(apps, schema_editor):
+    rename_colliding_shared_folders(apps, schema_editor)
+    # Shared rows are looked up with user1 as the lower user id
+    for model_name in ("SharedNote", "SharedFolder"):
+        model = apps.get_model("notes", model_name)
+        model.objects.filter(user1__gt=F("user2")).update(
+            user1=F("user2"), user2=F("user1")
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0013_tag_note_reverse_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(order_shared_pairs, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="sharednote",
+            index=models.Index(
+                fields=["user1", "user2", "-created_at"],
+                name="sharednote_pair_created_idx",
+            ),
+        ),
+    ]
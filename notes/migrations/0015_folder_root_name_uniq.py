@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-15 22:47
+
+from django.db import migrations, models
+
+
+def rename_duplicate_root_folders(apps, schema_editor):
+    # Root folders were only kept unique by a check in the views; give any
+    # duplicates that slipped through a numbered name before constraining
+    for model_name, owner_fields in (
+        ("Folder", ("user_id",)),
+        ("SharedFolder", ("user1_id", "user2_id")),
+    ):
+        model = apps.get_model("notes", model_name)
+        seen = set()
+        for folder in model.objects.filter(parent__isnull=True).order_by("id"):
+            owner = tuple(getattr(folder, field) for field in owner_fields)
+            name, n = folder.name, 1
+            while (owner, name) in seen:
+                n += 1
+                name = f"{folder.name[:90]} ({n})"
+            seen.add((owner, name))
+            if name != folder.name:
+                folder.name = name
+                folder.save(update_fields=["name"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0014_shared_pair_order"),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_duplicate_root_folders, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="folder",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("parent__isnull", True)),
+                fields=("user", "name"),
+                name="folder_root_name_uniq",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="sharedfolder",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("parent__isnull", True)),
+                fields=("user1", "user2", "name"),
+                name="sharedfolder_root_name_uniq",
+            ),
+        ),
+    ]
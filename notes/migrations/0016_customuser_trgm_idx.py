@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-15 23:10
+
+from django.db import migrations
+
+# search_users filters with icontains, which Postgres runs as
+# UPPER(col::text) LIKE UPPER('%q%'). Trigram indexes on that same expression
+# let the planner use them despite the leading wildcard.
+TRGM_INDEXES = {
+    "notes_customuser_username_trgm_idx": "username",
+    "notes_customuser_email_trgm_idx": "email",
+}
+
+
+def create_trgm_indexes(apps, schema_editor):
+    # Trigram indexes are Postgres-only; other backends keep scanning
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    for name, column in TRGM_INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON notes_customuser "
+            f"USING gin ((UPPER({column}::text)) gin_trgm_ops);"
+        )
+
+
+def drop_trgm_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in TRGM_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name};")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0015_folder_root_name_uniq"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trgm_indexes, drop_trgm_indexes),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-15 22:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0016_customuser_trgm_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(
+                fields=["from_user", "to_user", "-id"], name="chatmessage_pair_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="friendrequest",
+            index=models.Index(
+                fields=["to_user", "status"], name="friendreq_to_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="friendrequest",
+            index=models.Index(
+                fields=["from_user", "status"], name="friendreq_from_status_idx"
+            ),
+        ),
+    ]
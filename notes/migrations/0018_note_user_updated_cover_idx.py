@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-15 23:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notes", "0017_chat_friendrequest_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="note",
+            index=models.Index(
+                fields=["user", "-updated_at"],
+                include=("title", "note_type", "is_locked"),
+                name="note_user_updated_cover_idx",
+            ),
+        ),
+        # Drop the old index only once its replacement exists
+        migrations.RemoveIndex(
+            model_name="note",
+            name="note_user_updated_idx",
+        ),
+    ]
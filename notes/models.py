@@ -1,8 +1,16 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Lower
 from django.contrib.auth.models import AbstractUser
+import hashlib
 import json
 
 
+def content_digest(content):
+    """Short fingerprint of note content, for cheap equality checks"""
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
 class CustomUser(AbstractUser):
     """Custom user model extending Django's AbstractUser"""
 
@@ -29,6 +37,10 @@ class Tag(models.Model):
     class Meta:
         ordering = ["name"]
         unique_together = ["user", "name"]  # Each user can have unique tag names
+        indexes = [
+            # Serves case-insensitive tag lookups (LOWER(name) = ...)
+            models.Index(F("user"), Lower("name"), name="tag_user_name_lower_idx"),
+        ]
 
     def __str__(self):
         return self.name
@@ -58,6 +70,14 @@ class Folder(models.Model):
             "name",
             "parent",
         ]  # Unique folder names within same parent
+        constraints = [
+            # unique_together treats NULL parents as distinct, so cover root folders
+            models.UniqueConstraint(
+                fields=["user", "name"],
+                condition=models.Q(parent__isnull=True),
+                name="folder_root_name_uniq",
+            ),
+        ]
 
     def __str__(self):
         if self.parent:
@@ -99,6 +119,19 @@ class Note(models.Model):
 
     class Meta:
         ordering = ["-updated_at"]
+        indexes = [
+            # Covers the note_view sidebar query on PostgreSQL (INCLUDE is
+            # ignored elsewhere), so it can be answered by an index-only scan
+            models.Index(
+                fields=["user", "-updated_at"],
+                include=["title", "note_type", "is_locked"],
+                name="note_user_updated_cover_idx",
+            ),
+            models.Index(
+                fields=["user", "folder", "-updated_at"],
+                name="note_user_folder_updated_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -121,6 +154,33 @@ class Note(models.Model):
         }
 
 
+class NoteVersionQuerySet(models.QuerySet):
+    """Keeps content_hash in step on the bulk write paths that skip save()"""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.content_hash = content_digest(obj.content)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if "content" in fields:
+            objs = list(objs)
+            for obj in objs:
+                obj.content_hash = content_digest(obj.content)
+            fields = [*fields, "content_hash"]
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        if "content" in kwargs and "content_hash" not in kwargs:
+            content = kwargs["content"]
+            # An expression cannot be hashed here; leave those rows unhashed
+            kwargs["content_hash"] = (
+                content_digest(content) if isinstance(content, str) else ""
+            )
+        return super().update(**kwargs)
+
+
 class NoteVersion(models.Model):
     """Stores historical versions of notes"""
 
@@ -129,14 +189,27 @@ class NoteVersion(models.Model):
     content = models.TextField()  # This will also store encrypted content
     is_locked = models.BooleanField(default=False)
     salt = models.CharField(max_length=100, blank=True)
+    # Digest of content, so versions can be compared without reading the text
+    content_hash = models.CharField(max_length=32, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = NoteVersionQuerySet.as_manager()
+
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["note", "-created_at"], name="version_note_created_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.note.title} - {self.created_at}"
 
+    def save(self, *args, **kwargs):
+        self.content_hash = content_digest(self.content)
+        super().save(*args, **kwargs)
+
     def get_client_data(self):
         """Return data safe for client-side processing"""
         return {
@@ -177,15 +250,11 @@ class Friendship(models.Model):
 
     @classmethod
     def get_friends(cls, user):
-        """Get all friends of a user"""
-        friendships = cls.objects.filter(models.Q(user1=user) | models.Q(user2=user))
-        friends = []
-        for friendship in friendships:
-            if friendship.user1 == user:
-                friends.append(friendship.user2)
-            else:
-                friends.append(friendship.user1)
-        return friends
+        """Get all friends of a user, as one queryset ordered by username"""
+        return CustomUser.objects.filter(
+            models.Q(id__in=cls.objects.filter(user1=user).values("user2"))
+            | models.Q(id__in=cls.objects.filter(user2=user).values("user1"))
+        ).order_by("username")
 
 
 class FriendRequest(models.Model):
@@ -211,6 +280,13 @@ class FriendRequest(models.Model):
         ordering = ["-created_at"]
         # Ensure we don't have duplicate requests
         unique_together = [["from_user", "to_user"]]
+        indexes = [
+            # Serve the received/sent pending request lists in friends_list
+            models.Index(fields=["to_user", "status"], name="friendreq_to_status_idx"),
+            models.Index(
+                fields=["from_user", "status"], name="friendreq_from_status_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.from_user.username} -> {self.to_user.username} ({self.status})"
@@ -240,12 +316,26 @@ class SharedFolder(models.Model):
         ordering = ["name"]
         # Unique folder names within same parent for the same user pair
         unique_together = [["user1", "user2", "name", "parent"]]
+        constraints = [
+            # unique_together treats NULL parents as distinct, so cover root folders
+            models.UniqueConstraint(
+                fields=["user1", "user2", "name"],
+                condition=models.Q(parent__isnull=True),
+                name="sharedfolder_root_name_uniq",
+            ),
+        ]
 
     def __str__(self):
         if self.parent:
             return f"{self.parent.name}/{self.name}"
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Store the pair with the lower user id first so lookups need no OR
+        if self.user1_id > self.user2_id:
+            self.user1, self.user2 = self.user2, self.user1
+        super().save(*args, **kwargs)
+
     def get_full_path(self):
         """Get the full path of the folder"""
         path = [self.name]
@@ -257,7 +347,7 @@ class SharedFolder(models.Model):
 
     def has_access(self, user):
         """Check if a user has access to this shared folder"""
-        return user == self.user1 or user == self.user2
+        return user.pk in (self.user1_id, self.user2_id)
 
 
 class SharedNote(models.Model):
@@ -300,10 +390,22 @@ class SharedNote(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["user1", "user2", "-created_at"],
+                name="sharednote_pair_created_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.title} (shared by {self.user1.username} & {self.user2.username})"
 
+    def save(self, *args, **kwargs):
+        # Store the pair with the lower user id first so lookups need no OR
+        if self.user1_id > self.user2_id:
+            self.user1, self.user2 = self.user2, self.user1
+        super().save(*args, **kwargs)
+
     def get_client_data(self):
         """Return data safe for client-side processing"""
         return {
@@ -324,7 +426,7 @@ class SharedNote(models.Model):
 
     def has_access(self, user):
         """Check if a user has access to this shared note"""
-        return user == self.user1 or user == self.user2
+        return user.pk in (self.user1_id, self.user2_id)
 
 
 class ChatMessage(models.Model):
@@ -341,6 +443,12 @@ class ChatMessage(models.Model):
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            # friend_chat reads each direction of a conversation newest first
+            models.Index(
+                fields=["from_user", "to_user", "-id"], name="chatmessage_pair_id_idx"
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -422,29 +530,56 @@ class CanvasElement(models.Model):
         )
         return f"{self.element_type} in {note_title}"
 
-    def to_dict(self):
-        """Serialize element to dictionary"""
+    # Columns read by serialize_row(), so lists of elements can be fetched
+    # with .values() instead of building model instances
+    SERIALIZED_FIELDS = (
+        "id",
+        "element_type",
+        "x",
+        "y",
+        "width",
+        "height",
+        "z_index",
+        "text_content",
+        "image",
+        "stroke_color",
+        "fill_color",
+        "stroke_width",
+        "path_data",
+    )
+
+    @classmethod
+    def serialize_row(cls, row):
+        """Serialize a .values() row of SERIALIZED_FIELDS to a dictionary"""
+        element_type = row["element_type"]
         data = {
-            "id": self.id,
-            "element_type": self.element_type,
-            "x": self.x,
-            "y": self.y,
-            "width": self.width,
-            "height": self.height,
-            "z_index": self.z_index,
+            "id": row["id"],
+            "element_type": element_type,
+            "x": row["x"],
+            "y": row["y"],
+            "width": row["width"],
+            "height": row["height"],
+            "z_index": row["z_index"],
         }
 
-        if self.element_type == "textbox":
-            data["text_content"] = self.text_content
-        elif self.element_type == "image" and self.image:
-            data["image_url"] = self.image.url
-        elif self.element_type in ["rectangle", "circle", "line"]:
-            data["stroke_color"] = self.stroke_color
-            data["fill_color"] = self.fill_color
-            data["stroke_width"] = self.stroke_width
-        elif self.element_type == "freehand":
-            data["stroke_color"] = self.stroke_color
-            data["stroke_width"] = self.stroke_width
-            data["path_data"] = self.path_data
+        if element_type == "textbox":
+            data["text_content"] = row["text_content"]
+        elif element_type == "image" and row["image"]:
+            image_field = cls._meta.get_field("image")
+            data["image_url"] = image_field.storage.url(str(row["image"]))
+        elif element_type in ["rectangle", "circle", "line"]:
+            data["stroke_color"] = row["stroke_color"]
+            data["fill_color"] = row["fill_color"]
+            data["stroke_width"] = row["stroke_width"]
+        elif element_type == "freehand":
+            data["stroke_color"] = row["stroke_color"]
+            data["stroke_width"] = row["stroke_width"]
+            data["path_data"] = row["path_data"]
 
         return data
+
+    def to_dict(self):
+        """Serialize element to dictionary"""
+        return self.serialize_row(
+            {field: getattr(self, field) for field in self.SERIALIZED_FIELDS}
+        )
@@ -0,0 +1,95 @@
+from functools import partial
+
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Folder, Friendship, Note, Tag
+
+
+def folders_version_key(user_id):
+    """Cache key holding the version of a user's cached folder data"""
+    return f"folders_ver:{user_id}"
+
+
+def friend_ids_key(user_id):
+    """Cache key holding the set of a user's friend ids"""
+    return f"friends:{user_id}"
+
+
+def friends_fragment_key(user_id):
+    """Cache key of the friends section cached in friends_list.html"""
+    return make_template_fragment_key("friends", [user_id])
+
+
+def sidebar_notes_key(user_id):
+    """Cache key holding the note summaries listed in the note_view sidebar"""
+    return f"sidebar:{user_id}"
+
+
+def user_tags_key(user_id):
+    """Cache key holding a user's tags as served by tag autocomplete"""
+    return f"tags:{user_id}"
+
+
+def tags_version_key(user_id):
+    """Cache key holding the version of a user's tags, for page validators"""
+    return f"tags_ver:{user_id}"
+
+
+def _incr_version(key):
+    """Advance a cached version counter, if one is cached"""
+    try:
+        cache.incr(key)
+    except ValueError:
+        # No version cached yet; the next read starts a fresh one
+        pass
+
+
+def clear_user_tags_cache(user_id):
+    """Drop a user's cached tags and advance their tags version"""
+    cache.delete(user_tags_key(user_id))
+    _incr_version(tags_version_key(user_id))
+
+
+@receiver([post_save, post_delete], sender=Folder)
+def bump_folders_version(sender, instance, **kwargs):
+    """Invalidate the user's cached folder data whenever a folder changes.
+
+    The bump waits for commit, like the note and tag receivers, so a concurrent
+    read cannot cache pre-commit folders under the new version.
+    """
+    transaction.on_commit(partial(_incr_version, folders_version_key(instance.user_id)))
+
+
+@receiver([post_save, post_delete], sender=Friendship)
+def clear_friend_ids(sender, instance, **kwargs):
+    """Drop both users' cached friend data whenever a friendship changes.
+
+    Like the other receivers this waits for commit, so a concurrent read cannot
+    re-cache the pre-commit friend set.
+    """
+    keys = [
+        key(user_id)
+        for user_id in (instance.user1_id, instance.user2_id)
+        for key in (friend_ids_key, friends_fragment_key)
+    ]
+    transaction.on_commit(partial(cache.delete_many, keys))
+
+
+@receiver([post_save, post_delete], sender=Note)
+def clear_sidebar_notes(sender, instance, **kwargs):
+    """Drop the user's cached sidebar whenever one of their notes changes.
+
+    The delete waits for commit, so a concurrent read cannot re-cache the
+    pre-edit sidebar while an edit transaction is still open.
+    """
+    transaction.on_commit(partial(cache.delete, sidebar_notes_key(instance.user_id)))
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def clear_user_tags(sender, instance, **kwargs):
+    """Drop the user's cached tags whenever one of them changes"""
+    transaction.on_commit(partial(clear_user_tags_cache, instance.user_id))
@@ -1,14 +1,37 @@
-from django.test import TestCase
+import os
+
+from django.test import Client, TestCase, override_settings
 from .models import Note, NoteVersion, Folder, SharedFolder, Friendship
 
 
 class NoteVersionTestCase(TestCase):
-    def setUp(self):
-        """Set up test user and note"""
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test user once for the whole class"""
         from .models import CustomUser
-        self.user = CustomUser.objects.create_user(username='testuser', password='testpass')
-        self.client.login(username='testuser', password='testpass')
-        
+        cls.user = CustomUser.objects.create_user(username='testuser', password='testpass')
+
+    def setUp(self):
+        """Log in without re-hashing the password"""
+        self.client.force_login(self.user)
+        
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_cached_sidebar_invalidated_on_change(self):
+        """Test that the note_view sidebar reflects created and deleted notes"""
+        note = Note.objects.create(user=self.user, title='First', content='Content')
+        response = self.client.get(f'/note/{note.pk}/')
+        self.assertEqual([n['title'] for n in response.context['all_notes']], ['First'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other = Note.objects.create(user=self.user, title='Second', content='Content')
+        response = self.client.get(f'/note/{note.pk}/')
+        self.assertEqual([n['title'] for n in response.context['all_notes']], ['Second', 'First'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        response = self.client.get(f'/note/{note.pk}/')
+        self.assertEqual([n['title'] for n in response.context['all_notes']], ['First'])
+
     def test_version_created_on_edit(self):
         """Test that a version is created when a note is edited"""
         # Create a note
@@ -18,11 +41,12 @@ class NoteVersionTestCase(TestCase):
             content='Initial content'
         )
         
-        # Edit the note
-        self.client.post(f'/edit/{note.pk}/', {
-            'title': 'Test Note',
-            'content': 'Updated content'
-        })
+        # Edit the note (the version is written once the edit commits)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/edit/{note.pk}/', {
+                'title': 'Test Note',
+                'content': 'Updated content'
+            })
         
         # Check that a version was created
         versions = NoteVersion.objects.filter(note=note)
@@ -39,30 +63,47 @@ class NoteVersionTestCase(TestCase):
         )
         
         # Edit multiple times
-        self.client.post(f'/edit/{note.pk}/', {
-            'title': 'Test Note',
-            'content': 'Version 2'
-        })
-        
-        self.client.post(f'/edit/{note.pk}/', {
-            'title': 'Test Note',
-            'content': 'Version 3'
-        })
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/edit/{note.pk}/', {
+                'title': 'Test Note',
+                'content': 'Version 2'
+            })
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/edit/{note.pk}/', {
+                'title': 'Test Note',
+                'content': 'Version 3'
+            })
         
         # Check that two versions were created (original + first edit)
         versions = NoteVersion.objects.filter(note=note)
         self.assertEqual(versions.count(), 2)
         
+    def test_unchanged_edit_creates_no_version(self):
+        """Test that saving a note without changes does not add a version"""
+        note = Note.objects.create(
+            user=self.user,
+            title='Test Note',
+            content='Same content'
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/edit/{note.pk}/', {
+                'title': 'Test Note',
+                'content': 'Same content'
+            })
+
+        self.assertFalse(NoteVersion.objects.filter(note=note).exists())
+
     def test_history_view_requires_login(self):
         """Test that history view requires authentication"""
-        self.client.logout()
         note = Note.objects.create(
             user=self.user,
             title='Test Note',
             content='Test content'
         )
         
-        response = self.client.get(f'/history/{note.pk}/')
+        response = Client().get(f'/history/{note.pk}/')
         # Should redirect to login
         self.assertEqual(response.status_code, 302)
         self.assertIn('/login/', response.url)
@@ -79,6 +120,157 @@ class NoteVersionTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'History: Test Note')
 
+    def test_history_hides_version_matching_current_note(self):
+        """Test that the history omits versions identical to the current note"""
+        note = Note.objects.create(user=self.user, title='Test Note', content='Same')
+        NoteVersion.objects.create(note=note, title='Test Note', content='Same')
+        older = NoteVersion.objects.create(note=note, title='Test Note', content='Older')
+
+        response = self.client.get(f'/history/{note.pk}/')
+        self.assertEqual(list(response.context['versions']), [older])
+
+    def test_history_hides_bulk_written_version_matching_current_note(self):
+        """Test that versions written without save() are hashed or compared by text"""
+        note = Note.objects.create(user=self.user, title='Test Note', content='Same')
+        NoteVersion.objects.bulk_create([
+            NoteVersion(note=note, title='Test Note', content='Same'),
+        ])
+        legacy = NoteVersion.objects.create(note=note, title='Test Note', content='Older')
+        # A row from before content_hash existed
+        NoteVersion.objects.filter(pk=legacy.pk).update(content_hash='', content='Same')
+        older = NoteVersion.objects.create(note=note, title='Test Note', content='Older')
+
+        response = self.client.get(f'/history/{note.pk}/')
+        self.assertEqual(list(response.context['versions']), [older])
+
+    def test_history_paginated(self):
+        """Test that long histories are shown a page at a time, newest first"""
+        from .views import HISTORY_PAGE_SIZE
+        note = Note.objects.create(user=self.user, title='Test Note', content='Current')
+        NoteVersion.objects.bulk_create([
+            NoteVersion(note=note, title='Test Note', content=f'Version {i}')
+            for i in range(HISTORY_PAGE_SIZE + 5)
+        ])
+
+        response = self.client.get(f'/history/{note.pk}/')
+        versions = response.context['versions']
+        self.assertEqual(len(versions), HISTORY_PAGE_SIZE)
+        self.assertEqual(versions[0].content, f'Version {HISTORY_PAGE_SIZE + 4}')
+        self.assertTrue(response.context['has_older'])
+
+        response = self.client.get(f'/history/{note.pk}/?before={versions[-1].id}')
+        self.assertEqual(
+            [v.content for v in response.context['versions']],
+            [f'Version {i}' for i in range(4, -1, -1)]
+        )
+        self.assertFalse(response.context['has_older'])
+
+    def test_history_view_not_modified(self):
+        """Test that an unchanged note's history is served as 304"""
+        note = Note.objects.create(
+            user=self.user,
+            title='Test Note',
+            content='Test content'
+        )
+
+        etag = self.client.get(f'/history/{note.pk}/')['ETag']
+
+        response = self.client.get(f'/history/{note.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # An autosave within the same second still changes the page
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/edit/{note.pk}/', {
+                'title': 'Test Note',
+                'content': 'Edited content'
+            })
+        response = self.client.get(f'/history/{note.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_note_list_not_modified(self):
+        """Test that an unchanged note list is served as 304 until a note is deleted"""
+        note = Note.objects.create(user=self.user, title='First', content='Content')
+        Note.objects.create(user=self.user, title='Second', content='Content')
+
+        etag = self.client.get('/?folder=all')['ETag']
+        response = self.client.get('/?folder=all', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        note.delete()
+        response = self.client.get('/?folder=all', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([n.title for n in response.context['notes']], ['Second'])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_render_markdown_reuses_cached_render(self):
+        """Test that re-posting the same content does not render it again"""
+        from unittest import mock
+        from . import views
+
+        with mock.patch.object(views, 'markdown_format', wraps=views.markdown_format) as render:
+            for _ in range(2):
+                response = self.client.post('/render-markdown/', {'content': '# Cached heading'})
+                self.assertContains(response, '<h1>Cached heading</h1>')
+            self.client.post('/render-markdown/', {'content': '# Other heading'})
+        self.assertEqual(render.call_count, 2)
+
+
+class NoteImageUploadTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test user once for the whole class"""
+        from .models import CustomUser
+        cls.user = CustomUser.objects.create_user(username='testuser', password='testpass')
+
+    def setUp(self):
+        """Log in and point MEDIA_ROOT at a throwaway directory"""
+        import tempfile
+        self.client.force_login(self.user)
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.image_dir = os.path.join(media_root.name, 'note_images')
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_uploads_stored_by_content_hash(self):
+        """Test that uploads ignore the client filename and dedupe identical images"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        for name in ('../../escape.PNG', 'other.png'):
+            self.client.post('/create/', {
+                'title': 'Image note',
+                'content': 'Body',
+                'image': SimpleUploadedFile(name, b'same image bytes'),
+            })
+
+        stored = os.listdir(self.image_dir)
+        self.assertEqual(len(stored), 1)
+        self.assertRegex(stored[0], r'^[0-9a-f]{32}\.png$')
+        # Readable by a separate web server, like files saved through storage
+        mode = os.stat(os.path.join(self.image_dir, stored[0])).st_mode & 0o777
+        self.assertEqual(mode, 0o644)
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=0)
+    def test_spooled_uploads_moved_into_place(self):
+        """Test that uploads spooled to a temp file are stored and deduplicated the same way"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        for name in ('first.png', 'second.png'):
+            self.client.post('/create/', {
+                'title': 'Image note',
+                'content': 'Body',
+                'image': SimpleUploadedFile(name, b'spooled image bytes'),
+            })
+
+        stored = os.listdir(self.image_dir)
+        self.assertEqual(len(stored), 1)
+        with open(os.path.join(self.image_dir, stored[0]), 'rb') as f:
+            self.assertEqual(f.read(), b'spooled image bytes')
+        mode = os.stat(os.path.join(self.image_dir, stored[0])).st_mode & 0o777
+        self.assertEqual(mode, 0o644)
+
 
 class FolderTestCase(TestCase):
     def setUp(self):
@@ -131,6 +323,25 @@ class FolderTestCase(TestCase):
         note.refresh_from_db()
         self.assertEqual(note.folder, parent)
         
+    def test_folder_duplicate_names_rejected(self):
+        """Test that duplicate folder names are refused at root and in subfolders"""
+        parent = Folder.objects.create(user=self.user, name='Parent')
+        Folder.objects.create(user=self.user, name='Child', parent=parent)
+        sibling = Folder.objects.create(user=self.user, name='Sibling', parent=parent)
+
+        for data in ({'name': 'Parent'}, {'name': 'Child', 'parent': parent.id}):
+            response = self.client.post('/folders/create/', data)
+            self.assertEqual(
+                response.json(),
+                {'success': False, 'error': 'A folder with this name already exists'}
+            )
+
+        response = self.client.post(f'/folders/{sibling.id}/rename/', {'name': 'Child'})
+        self.assertFalse(response.json()['success'])
+        sibling.refresh_from_db()
+        self.assertEqual(sibling.name, 'Sibling')
+        self.assertEqual(Folder.objects.filter(user=self.user).count(), 3)
+
     def test_folder_list_filtered_by_folder(self):
         """Test that notes can be filtered by folder"""
         folder1 = Folder.objects.create(user=self.user, name='Folder 1')
@@ -155,6 +366,68 @@ class FolderTestCase(TestCase):
         self.assertContains(response, 'Note 1')
         self.assertNotContains(response, 'Note 2')
 
+    def test_folder_list_unknown_folder(self):
+        """Test that unknown or foreign folder ids fall back to all notes"""
+        from .models import CustomUser
+        other = CustomUser.objects.create_user(username='other', password='pass')
+        foreign = Folder.objects.create(user=other, name='Foreign')
+        Note.objects.create(user=self.user, title='Note 1', content='Content 1')
+
+        for folder_param in (foreign.id, 'abc'):
+            response = self.client.get(f'/?folder={folder_param}')
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.context['current_folder'])
+            self.assertContains(response, 'Note 1')
+
+    def test_folder_list_paginated(self):
+        """Test that the note list is paginated and keeps the folder filter"""
+        from .views import NOTES_PAGE_SIZE
+        folder = Folder.objects.create(user=self.user, name='Big Folder')
+        Note.objects.bulk_create([
+            Note(user=self.user, title=f'Note {i}', content='Content', folder=folder)
+            for i in range(NOTES_PAGE_SIZE + 1)
+        ])
+
+        response = self.client.get(f'/?folder={folder.id}')
+        self.assertEqual(len(response.context['notes']), NOTES_PAGE_SIZE)
+        self.assertContains(response, f'?folder={folder.id}&amp;page=2')
+
+        response = self.client.get(f'/?folder={folder.id}&page=2')
+        self.assertEqual(len(response.context['notes']), 1)
+
+    def test_note_list_loads_only_content_preview(self):
+        """Test that the note list carries a truncated preview instead of the full content"""
+        from .views import NOTE_PREVIEW_LENGTH
+        Note.objects.create(user=self.user, title='Long', content='a' * NOTE_PREVIEW_LENGTH + 'TAIL')
+
+        response = self.client.get('/')
+        note = response.context['notes'][0]
+        self.assertIn('content', note.get_deferred_fields())
+        self.assertEqual(note.preview, 'a' * NOTE_PREVIEW_LENGTH)
+        self.assertNotContains(response, 'TAIL')
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+    })
+    def test_cached_folders_json_invalidated_on_change(self):
+        """Test that cached folder data is refreshed when folders change"""
+        folder = Folder.objects.create(user=self.user, name='Old Name')
+        response = self.client.get('/create/')
+        self.assertIn('Old Name', response.context['folders_json'])
+        
+        # Rename through the view (the version is bumped on commit)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/folders/{folder.id}/rename/', {'name': 'New Name'})
+        response = self.client.get('/create/')
+        self.assertIn('New Name', response.context['folders_json'])
+        self.assertNotIn('Old Name', response.context['folders_json'])
+        
+        # Delete through the view
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/folders/{folder.id}/delete/')
+        response = self.client.get('/create/')
+        self.assertEqual(response.context['folders_json'], '[]')
+
 
 class SharedFolderTestCase(TestCase):
     def setUp(self):
@@ -203,71 +476,67 @@ class SharedFolderTestCase(TestCase):
 
 
 class DarkModeTestCase(TestCase):
-    def setUp(self):
-        """Set up test user"""
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test user once for the whole class"""
         from .models import CustomUser
-        self.user = CustomUser.objects.create_user(username='testuser', password='testpass')
-        self.client.login(username='testuser', password='testpass')
+        cls.user = CustomUser.objects.create_user(username='testuser', password='testpass')
+
+    def setUp(self):
+        """Log in without re-hashing the password"""
+        self.client.force_login(self.user)
         
-    def test_dark_mode_toggle_present(self):
-        """Test that dark mode toggle button is present in base template"""
+    def test_base_template_contents(self):
+        """Test that the base template renders theme controls and header links"""
         response = self.client.get('/')
         self.assertEqual(response.status_code, 200)
         # Check for theme toggle button
-        self.assertContains(response, 'id="themeToggle"')
-        self.assertContains(response, 'id="themeIcon"')
-        
-    def test_dark_mode_css_variables(self):
-        """Test that dark mode CSS variables are defined"""
-        response = self.client.get('/')
-        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'id="themeToggle"', msg_prefix='Theme toggle')
+        self.assertContains(response, 'id="themeIcon"', msg_prefix='Theme icon')
         # Check for CSS variables
-        self.assertContains(response, '--bg-primary')
-        self.assertContains(response, '--text-primary')
-        self.assertContains(response, '[data-theme="dark"]')
+        self.assertContains(response, '--bg-primary', msg_prefix='Dark mode CSS')
+        self.assertContains(response, '--text-primary', msg_prefix='Dark mode CSS')
+        self.assertContains(response, '[data-theme="dark"]', msg_prefix='Dark mode CSS')
+        # Check for Profile link in header
+        self.assertContains(response, 'Profile', msg_prefix='Profile link')
 
 
 class ProfileTestCase(TestCase):
-    def setUp(self):
-        """Set up test user"""
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test user once for the whole class"""
         from .models import CustomUser
-        self.user = CustomUser.objects.create_user(
+        cls.user = CustomUser.objects.create_user(
             username='testuser', 
             password='testpass123',
             email='test@example.com'
         )
-        self.client.login(username='testuser', password='testpass123')
+
+    def setUp(self):
+        """Log in without re-hashing the password"""
+        self.client.force_login(self.user)
         
-    def test_profile_page_accessible(self):
-        """Test that profile page is accessible to logged in users"""
+    def test_profile_page_contents(self):
+        """Test that profile page renders both the password and profile forms"""
         response = self.client.get('/profile/')
         self.assertEqual(response.status_code, 200)
-        self.assertContains(response, 'User Profile')
+        self.assertContains(response, 'User Profile', msg_prefix='Page header')
+        # Password change form
+        self.assertContains(response, 'Change Password', msg_prefix='Password form')
+        self.assertContains(response, 'Current Password', msg_prefix='Password form')
+        self.assertContains(response, 'New Password', msg_prefix='Password form')
+        # Profile update form
+        self.assertContains(response, 'Update Profile Information', msg_prefix='Profile form')
+        self.assertContains(response, 'First Name', msg_prefix='Profile form')
+        self.assertContains(response, 'Email', msg_prefix='Profile form')
         
     def test_profile_page_requires_login(self):
         """Test that profile page requires authentication"""
-        self.client.logout()
-        response = self.client.get('/profile/')
+        response = Client().get('/profile/')
         # Should redirect to login
         self.assertEqual(response.status_code, 302)
         self.assertIn('/login/', response.url)
         
-    def test_password_change_form_present(self):
-        """Test that password change form is present"""
-        response = self.client.get('/profile/')
-        self.assertEqual(response.status_code, 200)
-        self.assertContains(response, 'Change Password')
-        self.assertContains(response, 'Current Password')
-        self.assertContains(response, 'New Password')
-        
-    def test_profile_update_form_present(self):
-        """Test that profile update form is present"""
-        response = self.client.get('/profile/')
-        self.assertEqual(response.status_code, 200)
-        self.assertContains(response, 'Update Profile Information')
-        self.assertContains(response, 'First Name')
-        self.assertContains(response, 'Email')
-        
     def test_password_change_successful(self):
         """Test that password can be changed successfully"""
         response = self.client.post('/profile/', {
@@ -307,12 +576,6 @@ class ProfileTestCase(TestCase):
         self.assertEqual(user.last_name, 'User')
         self.assertEqual(user.email, 'newemail@example.com')
         self.assertEqual(user.bio, 'This is my bio')
-        
-    def test_profile_link_in_header(self):
-        """Test that Profile link appears in header for logged in users"""
-        response = self.client.get('/')
-        self.assertEqual(response.status_code, 200)
-        self.assertContains(response, 'Profile')
 
 
 class TagsTestCase(TestCase):
@@ -350,7 +613,31 @@ class TagsTestCase(TestCase):
         self.assertIn('results', data)
         self.assertEqual(len(data['results']), 1)
         self.assertEqual(data['results'][0]['name'], 'Python')
-        
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_tag_autocomplete_cache_invalidated_on_change(self):
+        """Test that cached autocomplete results pick up new and recolored tags"""
+        from .models import Tag
+        import json
+        Tag.objects.create(user=self.user, name='Python', color='#3b82f6')
+        self.assertEqual(len(self.client.get('/api/tags/autocomplete/?q=').json()['results']), 1)
+
+        # Tags created through the bulk helper (the cache is dropped on commit)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/create/', {
+                'title': 'Tagged',
+                'content': 'Content',
+                'tags': json.dumps([{'name': 'Pytest', 'color': '#16a34a'}]),
+            })
+        names = [t['name'] for t in self.client.get('/api/tags/autocomplete/?q=PY').json()['results']]
+        self.assertEqual(names, ['Pytest', 'Python'])
+
+        # Tags changed directly
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.filter(name='Pytest').get().delete()
+        names = [t['name'] for t in self.client.get('/api/tags/autocomplete/?q=py').json()['results']]
+        self.assertEqual(names, ['Python'])
+
     def test_note_with_tags(self):
         """Test creating a note with tags"""
         from .models import Tag, Note
@@ -381,6 +668,35 @@ class TagsTestCase(TestCase):
         self.assertTrue(note.tags.filter(name='Python').exists())
         self.assertTrue(note.tags.filter(name='Django').exists())
         
+    def test_note_tags_reuse_existing_case_insensitive(self):
+        """Test that saving tags reuses existing tags regardless of case"""
+        from .models import Tag, Note
+        import json
+        
+        tag = Tag.objects.create(user=self.user, name='Python', color='#3b82f6')
+        
+        tags_data = json.dumps([
+            {'name': 'python', 'color': '#16a34a'},
+            {'name': 'Django', 'color': '#ea580c'}
+        ])
+        
+        response = self.client.post('/create/', {
+            'title': 'Reused Tags',
+            'content': 'Content',
+            'tags': tags_data
+        })
+        self.assertEqual(response.status_code, 302)
+        
+        note = Note.objects.get(title='Reused Tags')
+        self.assertEqual(note.tags.count(), 2)
+        self.assertIn(tag, note.tags.all())
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        
+        # Color of the existing tag is updated
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Python')
+        self.assertEqual(tag.color, '#16a34a')
+        
     def test_tag_filtering(self):
         """Test filtering notes by tags"""
         from .models import Tag, Note
@@ -406,6 +722,64 @@ class TagsTestCase(TestCase):
         self.assertContains(response, 'Note 3')
         self.assertNotContains(response, 'Note 2')
         
+    def test_tag_filtering_multiple_tags(self):
+        """Test that filtering by several tags only returns notes having all of them"""
+        from .models import Tag, Note
+        
+        tag1 = Tag.objects.create(user=self.user, name='Python', color='#3b82f6')
+        tag2 = Tag.objects.create(user=self.user, name='Django', color='#16a34a')
+        
+        note1 = Note.objects.create(user=self.user, title='Note 1', content='Content 1')
+        note1.tags.add(tag1)
+        
+        note2 = Note.objects.create(user=self.user, title='Note 2', content='Content 2')
+        note2.tags.add(tag1, tag2)
+        
+        response = self.client.get('/?tags=python, DJANGO')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Note 2')
+        self.assertNotContains(response, 'Note 1')
+        
+    def test_tag_filtering_keeps_recent_first_order(self):
+        """Test that tag-filtered notes are listed most recently updated first"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import Tag, Note
+
+        tag = Tag.objects.create(user=self.user, name='Python', color='#3b82f6')
+        now = timezone.now()
+        for i, age in enumerate([3, 1, 0, 4, 2]):
+            note = Note.objects.create(user=self.user, title=f'N{i}', content='Content')
+            note.tags.add(tag)
+            Note.objects.filter(pk=note.pk).update(updated_at=now - timedelta(hours=age))
+
+        response = self.client.get('/?tags=python')
+        self.assertEqual(
+            [n.title for n in response.context['notes']],
+            ['N2', 'N1', 'N4', 'N0', 'N3']
+        )
+
+    def test_tag_filtering_paginated(self):
+        """Test that paging through tag-filtered notes shows each note exactly once"""
+        from django.utils import timezone
+        from .models import Tag, Note
+        from .views import NOTES_PAGE_SIZE
+
+        tag = Tag.objects.create(user=self.user, name='Python', color='#3b82f6')
+        notes = Note.objects.bulk_create([
+            Note(user=self.user, title=f'Note {i}', content='Content')
+            for i in range(2 * NOTES_PAGE_SIZE + 1)
+        ])
+        tag.notes.add(*notes)
+        # Give every note the same timestamp so only the tiebreak orders them
+        Note.objects.filter(user=self.user).update(updated_at=timezone.now())
+
+        seen = []
+        for page in (1, 2, 3):
+            response = self.client.get(f'/?tags=python&page={page}')
+            seen += [n.pk for n in response.context['notes']]
+        self.assertEqual(seen, sorted((n.pk for n in notes), reverse=True))
+
     def test_tag_case_insensitive(self):
         """Test that tags are case-insensitive"""
         from .models import Tag
@@ -476,7 +850,27 @@ class SharedNotesTestCase(TestCase):
         Friendship.objects.create(user1=self.user1, user2=self.user2)
         
         self.client.login(username='user1', password='pass1')
-        
+
+    def test_shared_note_form_offers_pair_tags(self):
+        """Test that the shared note form offers each tag used on the pair's notes once"""
+        from .models import CustomUser, SharedNote, Tag
+
+        mine = Tag.objects.create(user=self.user1, name='Mine')
+        theirs = Tag.objects.create(user=self.user2, name='Theirs')
+        Tag.objects.create(user=self.user1, name='Unused')
+        outsider = CustomUser.objects.create_user(username='outsider', password='pass')
+        elsewhere = Tag.objects.create(user=self.user1, name='Elsewhere')
+        SharedNote.objects.create(
+            user1=self.user1, user2=outsider, title='Other pair', content='x'
+        ).tags.add(elsewhere)
+        for title in ('One', 'Two'):
+            SharedNote.objects.create(
+                user1=self.user2, user2=self.user1, title=title, content='x'
+            ).tags.add(mine, theirs)
+
+        response = self.client.get(f'/friends/{self.user2.id}/shared-notes/create/')
+        self.assertEqual(list(response.context['user_tags']), [mine, theirs])
+
     def test_shared_note_with_tags(self):
         """Test creating a shared note with tags"""
         from .models import SharedNote, Tag
@@ -583,6 +977,95 @@ class SharedNotesTestCase(TestCase):
         self.assertTrue(shared_note.tags.filter(name='Original').exists())
         self.assertTrue(shared_note.tags.filter(name='Updated').exists())
 
+    def test_shared_pair_stored_in_id_order(self):
+        """Test that shared notes and folders store the lower user id as user1"""
+        from .models import SharedNote
+
+        folder = SharedFolder.objects.create(user1=self.user2, user2=self.user1, name='Reversed')
+        shared_note = SharedNote.objects.create(
+            user1=self.user2, user2=self.user1, created_by=self.user2,
+            title='Reversed pair', content='Content', folder=folder
+        )
+        self.assertEqual((shared_note.user1, shared_note.user2), (self.user1, self.user2))
+        self.assertEqual((folder.user1, folder.user2), (self.user1, self.user2))
+
+        response = self.client.get(f'/friends/{self.user2.id}/shared-notes/?folder={folder.id}')
+        self.assertContains(response, 'Reversed pair')
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shared-tag-etag',
+    }})
+    def test_shared_note_tag_edit_revalidates_note_list(self):
+        """Test that recoloring a tag from a shared note is not hidden behind a 304"""
+        from .models import SharedNote, Tag
+        import json
+
+        Tag.objects.create(user=self.user1, name='Python', color='#3b82f6')
+        shared_note = SharedNote.objects.create(
+            user1=self.user1, user2=self.user2, created_by=self.user1,
+            title='Shared', content='Content'
+        )
+        etag = self.client.get('/?folder=all')['ETag']
+        self.assertEqual(
+            self.client.get('/?folder=all', HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/shared-notes/{shared_note.id}/edit/', {
+                'title': 'Shared',
+                'content': 'Content',
+                'tags': json.dumps([{'name': 'Python', 'color': '#16a34a'}]),
+            }, follow=True)
+        response = self.client.get('/?folder=all', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_shared_notes_list_unknown_folder(self):
+        """Test that unknown or malformed folder ids fall back to all shared notes"""
+        from .models import SharedNote
+
+        SharedNote.objects.create(
+            user1=self.user1, user2=self.user2, created_by=self.user1,
+            title='Shared 1', content='Content'
+        )
+        for folder_param in (999999, 'abc'):
+            response = self.client.get(
+                f'/friends/{self.user2.id}/shared-notes/?folder={folder_param}'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.context['current_folder'])
+            self.assertContains(response, 'Shared 1')
+
+    def test_shared_note_ajax_update(self):
+        """Test that AJAX checkbox updates change content only for participants"""
+        from .models import CustomUser, SharedNote
+
+        shared_note = SharedNote.objects.create(
+            user1=self.user1, user2=self.user2, created_by=self.user1,
+            title='Checklist', content='- [ ] task'
+        )
+        original_updated_at = shared_note.updated_at
+
+        response = self.client.post(f'/shared-notes/{shared_note.id}/edit/', {
+            'content': '- [x] task',
+            'ajax_update': 'true',
+        })
+        self.assertEqual(response.json(), {'success': True})
+        shared_note.refresh_from_db()
+        self.assertEqual(shared_note.content, '- [x] task')
+        self.assertEqual(shared_note.title, 'Checklist')
+        self.assertGreater(shared_note.updated_at, original_updated_at)
+
+        CustomUser.objects.create_user(username='outsider', password='pass3')
+        self.client.login(username='outsider', password='pass3')
+        response = self.client.post(f'/shared-notes/{shared_note.id}/edit/', {
+            'content': 'hijacked',
+            'ajax_update': 'true',
+        })
+        self.assertRedirects(response, '/friends/')
+        shared_note.refresh_from_db()
+        self.assertEqual(shared_note.content, '- [x] task')
+
 
 class CanvasNotesTestCase(TestCase):
     def setUp(self):
@@ -649,6 +1132,38 @@ class CanvasNotesTestCase(TestCase):
         self.assertEqual(element.element_type, 'textbox')
         self.assertEqual(element.text_content, 'Hello canvas')
         
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'canvas-etag',
+    }})
+    def test_canvas_view_revalidated_after_element_create(self):
+        """Test that a new element is not hidden behind a 304 of the canvas page"""
+        from .models import Note
+        import json
+
+        note = Note.objects.create(
+            user=self.user,
+            title='Test Canvas Note',
+            note_type='canvas',
+            content=''
+        )
+        etag = self.client.get(f'/note/{note.pk}/')['ETag']
+        self.assertEqual(
+            self.client.get(f'/note/{note.pk}/', HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+
+        self.client.post('/canvas/elements/create/',
+            data=json.dumps({
+                'note_id': note.id,
+                'element_type': 'textbox',
+                'text_content': 'Hello canvas',
+            }),
+            content_type='application/json'
+        )
+        response = self.client.get(f'/note/{note.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Hello canvas', response.context['elements_json'])
+
     def test_canvas_element_update(self):
         """Test that canvas elements can be updated"""
         from .models import Note, CanvasElement
@@ -841,3 +1356,201 @@ class CanvasNotesTestCase(TestCase):
         element = CanvasElement.objects.get(note=note)
         self.assertEqual(element.element_type, 'freehand')
         self.assertEqual(element.path_data, 'M 0 0 L 10 10 L 20 5')
+
+    def test_canvas_element_update_touches_note(self):
+        """Test that changing an element bumps its note's updated_at"""
+        from .models import CanvasElement, Note
+        import json
+
+        note = Note.objects.create(user=self.user, title='Canvas', note_type='canvas', content='')
+        element = CanvasElement.objects.create(note=note, element_type='textbox')
+        before = note.updated_at
+
+        self.client.post(
+            f'/canvas/elements/{element.id}/update/',
+            data=json.dumps({'x': 10}),
+            content_type='application/json'
+        )
+        note.refresh_from_db()
+        self.assertGreater(note.updated_at, before)
+        self.assertEqual(note.title, 'Canvas')
+
+    def test_canvas_element_update_writes_only_changed_fields(self):
+        """Test that an element update does not rewrite untouched columns"""
+        from .models import CanvasElement, Note
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        import json
+
+        note = Note.objects.create(user=self.user, title='Canvas', note_type='canvas', content='')
+        element = CanvasElement.objects.create(note=note, element_type='textbox')
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(
+                f'/canvas/elements/{element.id}/update/',
+                data=json.dumps({'x': 10}),
+                content_type='application/json'
+            )
+        update = next(
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith('UPDATE "notes_canvaselement"')
+        )
+        self.assertIn('"x"', update)
+        self.assertNotIn('"text_content"', update)
+
+    def test_canvas_element_access_denied(self):
+        """Test that elements of other users' notes cannot be changed"""
+        from .models import CanvasElement, CustomUser, Note, SharedNote
+        import json
+
+        other = CustomUser.objects.create_user(username='other', password='pass')
+        third = CustomUser.objects.create_user(username='third', password='pass')
+        note = Note.objects.create(user=other, title='Theirs', note_type='canvas', content='')
+        shared_note = SharedNote.objects.create(
+            user1=other, user2=third, title='Not mine', note_type='canvas', content=''
+        )
+
+        for element in (
+            CanvasElement.objects.create(note=note, element_type='textbox'),
+            CanvasElement.objects.create(shared_note=shared_note, element_type='textbox'),
+        ):
+            response = self.client.post(
+                f'/canvas/elements/{element.id}/update/',
+                data=json.dumps({'x': 500}),
+                content_type='application/json'
+            )
+            self.assertEqual(response.json(), {'success': False, 'error': 'Access denied'})
+            element.refresh_from_db()
+            self.assertEqual(element.x, 0)
+
+    def test_canvas_view_elements_json(self):
+        """Test that note_view serializes elements the same way as to_dict"""
+        from .models import Note, CanvasElement
+        import json
+
+        note = Note.objects.create(
+            user=self.user, title='Canvas', note_type='canvas', content=''
+        )
+        elements = [
+            CanvasElement.objects.create(note=note, element_type='textbox', text_content='Hi'),
+            CanvasElement.objects.create(note=note, element_type='image', image='canvas_images/a.png', z_index=1),
+            CanvasElement.objects.create(note=note, element_type='circle', fill_color='#ff0000', z_index=2),
+            CanvasElement.objects.create(note=note, element_type='freehand', path_data='[[1,2]]', z_index=3),
+        ]
+        CanvasElement.objects.create(note=note, element_type='line', deleted=True)
+
+        response = self.client.get(f'/view/{note.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            json.loads(response.context['elements_json']),
+            [element.to_dict() for element in elements],
+        )
+
+
+class SearchUsersTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """Set up a searching user, a friend and users with pending requests"""
+        from .models import CustomUser, FriendRequest
+        cls.user = CustomUser.objects.create_user(username='searcher', password='pass')
+        cls.friend = CustomUser.objects.create_user(username='match_friend', password='pass')
+        cls.requested = CustomUser.objects.create_user(username='match_requested', password='pass')
+        cls.requester = CustomUser.objects.create_user(username='match_requester', password='pass')
+        cls.stranger = CustomUser.objects.create_user(username='match_stranger', password='pass')
+
+        Friendship.objects.create(user1=cls.user, user2=cls.friend)
+        cls.sent = FriendRequest.objects.create(from_user=cls.user, to_user=cls.requested)
+        cls.received = FriendRequest.objects.create(from_user=cls.requester, to_user=cls.user)
+
+    def setUp(self):
+        """Log in without re-hashing the password"""
+        self.client.force_login(self.user)
+
+    def test_search_results_friend_status(self):
+        """Test that search results report friendship and pending requests"""
+        response = self.client.get('/friends/search/?q=match')
+        self.assertEqual(response.status_code, 200)
+        results = {r['username']: r for r in response.context['results']}
+        self.assertEqual(len(results), 4)
+
+        self.assertTrue(results['match_friend']['is_friend'])
+        self.assertIsNone(results['match_friend']['pending_request'])
+
+        self.assertEqual(results['match_requested']['pending_request'], self.sent.id)
+        self.assertTrue(results['match_requested']['pending_from_me'])
+
+        self.assertEqual(results['match_requester']['pending_request'], self.received.id)
+        self.assertFalse(results['match_requester']['pending_from_me'])
+
+        self.assertFalse(results['match_stranger']['is_friend'])
+        self.assertIsNone(results['match_stranger']['pending_request'])
+
+    def test_friends_list_shows_friends(self):
+        """Test that the friends list shows friendships from either side"""
+        Friendship.objects.create(user1=self.requester, user2=self.user)
+        response = self.client.get('/friends/')
+        self.assertContains(response, 'class="friend-card"', count=2)
+        self.assertContains(response, 'match_friend')
+        self.assertNotContains(response, 'match_stranger')
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_cached_friends_list_invalidated_on_change(self):
+        """Test that the cached friends section picks up new friendships"""
+        self.assertNotContains(self.client.get('/friends/'), 'match_stranger')
+        with self.captureOnCommitCallbacks(execute=True):
+            Friendship.objects.create(user1=self.stranger, user2=self.user)
+        self.assertContains(self.client.get('/friends/'), 'match_stranger')
+
+
+class FriendChatTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """Set up two friends with a long chat history"""
+        from .models import ChatMessage, CustomUser
+        cls.user = CustomUser.objects.create_user(username='chatter', password='pass')
+        cls.friend = CustomUser.objects.create_user(username='chat_friend', password='pass')
+        Friendship.objects.create(user1=cls.user, user2=cls.friend)
+        ChatMessage.objects.bulk_create([
+            ChatMessage(from_user=cls.user if i % 2 else cls.friend,
+                        to_user=cls.friend if i % 2 else cls.user,
+                        message=f'Message {i}')
+            for i in range(150)
+        ])
+
+    def setUp(self):
+        """Log in without re-hashing the password"""
+        self.client.force_login(self.user)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_cached_friend_ids_invalidated_on_change(self):
+        """Test that ending a friendship revokes chat access despite the cache"""
+        url = f'/friends/{self.friend.id}/chat/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Friendship.objects.filter(user1=self.user, user2=self.friend).delete()
+        self.assertRedirects(self.client.get(url), '/friends/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Friendship.objects.create(user1=self.friend, user2=self.user)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_chat_shows_latest_page(self):
+        """Test that the chat shows the latest messages in chronological order"""
+        from .views import CHAT_PAGE_SIZE
+        response = self.client.get(f'/friends/{self.friend.id}/chat/')
+        self.assertEqual(response.status_code, 200)
+        shown = [m.message for m in response.context['chat_messages']]
+        self.assertEqual(shown, [f'Message {i}' for i in range(150 - CHAT_PAGE_SIZE, 150)])
+        self.assertTrue(response.context['has_earlier'])
+
+    def test_chat_loads_earlier_messages(self):
+        """Test that ?before=<id> returns the page preceding that message"""
+        from .views import CHAT_PAGE_SIZE
+        first_shown = self.client.get(
+            f'/friends/{self.friend.id}/chat/'
+        ).context['chat_messages'][0]
+        response = self.client.get(f'/friends/{self.friend.id}/chat/?before={first_shown.id}')
+        shown = [m.message for m in response.context['chat_messages']]
+        self.assertEqual(shown, [f'Message {i}' for i in range(150 - CHAT_PAGE_SIZE)])
+        self.assertFalse(response.context['has_earlier'])
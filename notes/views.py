@@ -1,9 +1,41 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from functools import partial
+
 from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import Http404, JsonResponse
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseNotAllowed,
+    JsonResponse,
+)
 from django.contrib.auth import update_session_auth_hash
-from django.db.models import Q
+from django.core.cache import cache
+from django.core.files.move import file_move_safe
+from django.core.paginator import Paginator
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    BooleanField,
+    Case,
+    Count,
+    Exists,
+    Max,
+    OuterRef,
+    Q,
+    Value,
+    When,
+)
+from django.db.models.functions import Lower, Substr
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from .models import (
     Note,
     NoteVersion,
@@ -15,17 +47,271 @@ from .models import (
     ChatMessage,
     Folder,
     SharedFolder,
+    CanvasElement,
+    content_digest,
 )
 from .forms import CustomUserChangeForm, CustomPasswordChangeForm
+from .signals import (
+    clear_user_tags_cache,
+    folders_version_key,
+    friend_ids_key,
+    sidebar_notes_key,
+    tags_version_key,
+    user_tags_key,
+)
+from .templatetags.markdown_extras import markdown_format
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj).decode()
+
+    # Accepts bytes (request.body) as well as str; its JSONDecodeError
+    # subclasses json.JSONDecodeError
+    _json_loads = orjson.loads
+
+except ImportError:  # pragma: no cover - orjson is optional
+    _json_dumps = json.dumps
+    _json_loads = json.loads
+
+# Number of notes shown per page in note_list
+NOTES_PAGE_SIZE = 50
+# List cards clamp their preview to a few lines, so only this much is loaded
+NOTE_PREVIEW_LENGTH = 500
+
+# Number of chat messages shown per page in friend_chat
+CHAT_PAGE_SIZE = 100
+HISTORY_PAGE_SIZE = 50
+
+# Seconds a user's friend ids stay cached (they are also cleared on change)
+FRIEND_IDS_TIMEOUT = 3600
+USER_TAGS_TIMEOUT = 60
+SIDEBAR_NOTES_TIMEOUT = 60
+MARKDOWN_CACHE_TIMEOUT = 600
+
+# Read size used when writing uploaded note images to disk
+IMAGE_CHUNK_SIZE = 1024 * 1024
+
+
+def _resolve_tags(user, tags_list):
+    """Get or create the user's tags named in tags_list (case-insensitive).
+
+    Existing tags get their color updated if it changed. Uses a constant number
+    of queries regardless of how many tags are given.
+    """
+    wanted = {}
+    for tag_data in tags_list:
+        tag_name = tag_data.get("name", "").strip()
+        tag_color = tag_data.get("color", "#3b82f6")
+        if tag_name:
+            # Keep the first spelling of a name, but the last color given for it
+            name = wanted.get(tag_name.lower(), (tag_name, None))[0]
+            wanted[tag_name.lower()] = (name, tag_color)
+    if not wanted:
+        return []
+
+    user_tags = Tag.objects.alias(name_lower=Lower("name")).filter(user=user)
+    existing = {
+        tag.name.lower(): tag for tag in user_tags.filter(name_lower__in=wanted)
+    }
+
+    # Update colors that changed
+    changed = []
+    for key, tag in existing.items():
+        tag_color = wanted[key][1]
+        if tag.color != tag_color:
+            tag.color = tag_color
+            changed.append(tag)
+    if changed:
+        Tag.objects.bulk_update(changed, ["color"])
+
+    # Create the missing ones, then fetch them back for their ids
+    missing = [
+        Tag(user=user, name=name, color=tag_color)
+        for key, (name, tag_color) in wanted.items()
+        if key not in existing
+    ]
+    if missing:
+        Tag.objects.bulk_create(missing, ignore_conflicts=True)
+        existing.update(
+            (tag.name.lower(), tag)
+            for tag in user_tags.filter(
+                name_lower__in=[tag.name.lower() for tag in missing]
+            )
+        )
+
+    # Bulk writes send no signals, so drop the cached tags here (once
+    # committed, so a concurrent read cannot re-cache the old tags)
+    if changed or missing:
+        transaction.on_commit(partial(clear_user_tags_cache, user.pk))
+
+    return list(existing.values())
+
+
+def _sync_note_tags(user, note, tags_data):
+    """Set a note's tags from the JSON payload submitted by the note form"""
+    try:
+        tags_list = _json_loads(tags_data) if tags_data else []
+    except (json.JSONDecodeError, ValueError):
+        return
+    note.tags.set(_resolve_tags(user, tags_list))
+
+
+def _apply_upload_permissions(path):
+    """Give a moved-in upload the configured mode; temp files are created 0600"""
+    os.chmod(path, settings.FILE_UPLOAD_PERMISSIONS or 0o644)
+
+
+def _save_note_image(image):
+    """Save an uploaded note image under a content-hash name and return the name
+
+    The client-supplied filename is only used for its extension, so uploads
+    cannot escape the media directory or overwrite each other, and identical
+    images are stored once.
+    """
+    media_dir = os.path.join(settings.MEDIA_ROOT, "note_images")
+    os.makedirs(media_dir, exist_ok=True)
+    ext = os.path.splitext(os.path.basename(image.name))[1].lower()
+    digest = hashlib.blake2b(digest_size=16)
+
+    if hasattr(image, "temporary_file_path"):
+        # Large uploads are already spooled to disk: hash them in place and
+        # move the spooled file rather than writing a second copy
+        for chunk in image.chunks(chunk_size=IMAGE_CHUNK_SIZE):
+            digest.update(chunk)
+        filename = f"{digest.hexdigest()}{ext}"
+        image_path = os.path.join(media_dir, filename)
+        if not os.path.exists(image_path):
+            file_move_safe(image.temporary_file_path(), image_path)
+            _apply_upload_permissions(image_path)
+        return filename
+
+    # Write to a private temp file while hashing, then move it into place
+    fd, tmp_path = tempfile.mkstemp(dir=media_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as destination:
+            for chunk in image.chunks(chunk_size=IMAGE_CHUNK_SIZE):
+                digest.update(chunk)
+                destination.write(chunk)
+
+        filename = f"{digest.hexdigest()}{ext}"
+        image_path = os.path.join(media_dir, filename)
+        if os.path.exists(image_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, image_path)
+            _apply_upload_permissions(image_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return filename
+
+
+def _folders_json(folders):
+    """Serialize a folder queryset (personal or shared) for the JS folder tree"""
+    return _json_dumps(list(folders.values("id", "name", "parent_id")))
+
+
+def _pair_filter(user, friend, prefix=""):
+    """Lookup kwargs matching rows shared between two users
+
+    Shared notes and folders store the pair with the lower user id as user1
+    (see SharedNote.save()), so a single equality per column matches them.
+    """
+    user1, user2 = sorted([user, friend], key=lambda u: u.id)
+    return {f"{prefix}user1": user1, f"{prefix}user2": user2}
+
+
+def _shared_pair_tags(user, friend):
+    """Tags of either user that appear on at least one note the two share
+
+    Checked with an EXISTS semi-join on the M2M table, served by its
+    (tag_id, sharednote_id) index, so no DISTINCT over joined rows is needed.
+    """
+    on_shared_note = SharedNote.tags.through.objects.filter(
+        tag=OuterRef("pk"), **_pair_filter(user, friend, prefix="sharednote__")
+    )
+    return Tag.objects.filter(Q(user=user) | Q(user=friend), Exists(on_shared_note))
+
+
+def _folder_from_param(folders, folder_id):
+    """Pick the folder with the id given in a request parameter, if listed"""
+    if folder_id and folder_id.isdigit():
+        return next((f for f in folders if f.id == int(folder_id)), None)
+    return None
+
+
+def _user_folders_json(user):
+    """Serialized personal folders of a user, cached until one of them changes"""
+    version = cache.get_or_set(folders_version_key(user.pk), time.time_ns)
+    key = f"folders_json:{user.pk}:{version}"
+    folders_json = cache.get(key)
+    if folders_json is None:
+        folders_json = _folders_json(Folder.objects.filter(user=user))
+        cache.set(key, folders_json)
+    return folders_json
+
+
+def _friend_ids(user):
+    """Ids of a user's friends, cached until one of their friendships changes"""
+
+    def fetch():
+        pairs = Friendship.objects.filter(Q(user1=user) | Q(user2=user)).values_list(
+            "user1_id", "user2_id"
+        )
+        return {
+            user2_id if user1_id == user.pk else user1_id
+            for user1_id, user2_id in pairs
+        }
+
+    return cache.get_or_set(friend_ids_key(user.pk), fetch, FRIEND_IDS_TIMEOUT)
+
+
+def _user_notes_etag(request, pk=None):
+    """ETag of the pages built from all of the user's notes and folders.
+
+    Deletes do not advance the newest updated_at, so the note count is part of
+    the tag; folder and tag changes (tags are also edited from shared notes)
+    come in through their cached versions, and canvas element changes touch
+    their note. Only plain GETs without pending flash messages are ever
+    answered with a 304.
+    """
+    if request.method != "GET" or len(messages.get_messages(request)):
+        return None
+    stats = Note.objects.filter(user=request.user).aggregate(
+        count=Count("pk"), latest=Max("updated_at")
+    )
+    latest = stats["latest"].isoformat() if stats["latest"] else ""
+    folders_version = cache.get_or_set(
+        folders_version_key(request.user.pk), time.time_ns
+    )
+    tags_version = cache.get_or_set(tags_version_key(request.user.pk), time.time_ns)
+    return f"{stats['count']}-{latest}-{folders_version}-{tags_version}"
 
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_user_notes_etag)
 def note_list(request):
-    notes = Note.objects.filter(user=request.user)
+    notes = (
+        Note.objects.filter(user=request.user)
+        .select_related("folder")
+        .prefetch_related("tags")
+        .defer("content")
+        .annotate(preview=Substr("content", 1, NOTE_PREVIEW_LENGTH))
+    )
 
     # Filter by tags if specified
     tag_filter = request.GET.get("tags", "").strip()
 
+    # Get all folders for the sidebar; the current folder and its subfolders
+    # are picked from the same rows
+    folders = list(Folder.objects.filter(user=request.user).select_related("parent"))
+
     # Filter by folder if specified (but not when searching by tags)
     folder_id = request.GET.get("folder")
     current_folder = None
@@ -33,10 +319,16 @@ def note_list(request):
     if tag_filter:
         # When searching by tags, show results from ALL folders
         # Split by comma and filter (case-insensitive)
-        tag_names = [t.strip() for t in tag_filter.split(",") if t.strip()]
-        for tag_name in tag_names:
-            notes = notes.filter(tags__name__iexact=tag_name)
-        notes = notes.distinct()
+        tag_names = {t.strip().lower() for t in tag_filter.split(",") if t.strip()}
+        # Join the tags once and keep notes that matched every requested name
+        notes = (
+            notes.alias(tag_name_lower=Lower("tags__name"))
+            .filter(tag_name_lower__in=tag_names)
+            .annotate(matched_tags=Count("tag_name_lower", distinct=True))
+            .filter(matched_tags=len(tag_names))
+            # The GROUP BY drops Meta.ordering, so restore it explicitly
+            .order_by("-updated_at")
+        )
         # Don't apply folder filtering when searching by tags
     else:
         # Only apply folder filtering when NOT searching by tags
@@ -44,51 +336,39 @@ def note_list(request):
             # Don't filter by folder, show all notes
             pass
         elif folder_id:
-            try:
-                current_folder = Folder.objects.get(id=folder_id, user=request.user)
+            current_folder = _folder_from_param(folders, folder_id)
+            if current_folder:
                 notes = notes.filter(folder=current_folder)
-            except Folder.DoesNotExist:
-                pass
         else:  # Default to Home (no folder) when no folder parameter or empty string
             notes = notes.filter(folder__isnull=True)
 
     # Get all tags for the current user
     user_tags = Tag.objects.filter(user=request.user)
 
-    # Get all folders for the sidebar
-    folders = Folder.objects.filter(user=request.user)
-
     # Get subfolders for the current folder if viewing a specific folder
     # For Home view (no current folder), show root-level folders
     subfolders = []
-    if current_folder:
-        subfolders = Folder.objects.filter(
-            user=request.user, parent=current_folder
-        ).order_by("name")
-    elif folder_id != "all":  # Home view - show root folders
-        subfolders = Folder.objects.filter(
-            user=request.user, parent__isnull=True
-        ).order_by("name")
+    if current_folder or folder_id != "all":
+        parent_id = current_folder.id if current_folder else None
+        subfolders = sorted(
+            (f for f in folders if f.parent_id == parent_id), key=lambda f: f.name
+        )
 
     # Serialize folders for JavaScript
-    import json
+    folders_json = _user_folders_json(request.user)
 
-    folders_json = json.dumps(
-        [
-            {
-                "id": folder.id,
-                "name": folder.name,
-                "parent_id": folder.parent.id if folder.parent else None,
-            }
-            for folder in folders
-        ]
-    )
+    # Show one page of notes at a time; the id tiebreak keeps pages from
+    # repeating or skipping notes that share an updated_at
+    page_obj = Paginator(
+        notes.order_by("-updated_at", "-id"), NOTES_PAGE_SIZE
+    ).get_page(request.GET.get("page"))
 
     return render(
         request,
         "notes/note_list.html",
         {
-            "notes": notes,
+            "notes": page_obj,
+            "page_obj": page_obj,
             "user_tags": user_tags,
             "selected_tags": tag_filter,
             "folders": folders,
@@ -137,55 +417,20 @@ def note_create(request):
 
             # Assign folder if specified
             if folder_id:
-                try:
-                    folder = Folder.objects.get(id=folder_id, user=request.user)
-                    note.folder = folder
-                except Folder.DoesNotExist:
-                    pass
+                note.folder = Folder.objects.filter(
+                    id=folder_id, user=request.user
+                ).first()
 
             # Handle image upload (legacy)
             if image:
-                import os
-                from django.conf import settings
-
-                # Create media directory if it doesn't exist
-                media_dir = os.path.join(settings.MEDIA_ROOT, "note_images")
-                os.makedirs(media_dir, exist_ok=True)
-
-                # Save the image
-                image_path = os.path.join(media_dir, image.name)
-                with open(image_path, "wb+") as destination:
-                    for chunk in image.chunks():
-                        destination.write(chunk)
+                _save_note_image(image)
 
-            note.save()
+            with transaction.atomic():
+                note.save()
 
-            # Process tags (only for markdown notes)
-            if note_type == "markdown" and tags_data:
-                import json
-
-                try:
-                    tags_list = json.loads(tags_data)
-                    for tag_data in tags_list:
-                        tag_name = tag_data.get("name", "").strip()
-                        tag_color = tag_data.get("color", "#3b82f6")
-                        if tag_name:
-                            # Get or create tag (case-insensitive)
-                            try:
-                                tag = Tag.objects.get(
-                                    user=request.user, name__iexact=tag_name
-                                )
-                                # Update color if changed
-                                if tag.color != tag_color:
-                                    tag.color = tag_color
-                                    tag.save()
-                            except Tag.DoesNotExist:
-                                tag = Tag.objects.create(
-                                    user=request.user, name=tag_name, color=tag_color
-                                )
-                            note.tags.add(tag)
-                except (json.JSONDecodeError, ValueError):
-                    pass
+                # Process tags (only for markdown notes)
+                if note_type == "markdown" and tags_data:
+                    _sync_note_tags(request.user, note, tags_data)
 
             messages.success(request, "Note created successfully!")
             return redirect("note_view", pk=note.pk)
@@ -195,29 +440,12 @@ def note_create(request):
     # Get all user tags for autocomplete
     user_tags = Tag.objects.filter(user=request.user)
     # Get all folders for the folder selector
-    folders = Folder.objects.filter(user=request.user)
+    folders = list(Folder.objects.filter(user=request.user))
     # Get current folder from query param if provided
-    current_folder_id = request.GET.get("folder")
-    current_folder = None
-    if current_folder_id:
-        try:
-            current_folder = Folder.objects.get(id=current_folder_id, user=request.user)
-        except Folder.DoesNotExist:
-            pass
+    current_folder = _folder_from_param(folders, request.GET.get("folder"))
 
     # Serialize folders for JavaScript
-    import json
-
-    folders_json = json.dumps(
-        [
-            {
-                "id": folder.id,
-                "name": folder.name,
-                "parent_id": folder.parent.id if folder.parent else None,
-            }
-            for folder in folders
-        ]
-    )
+    folders_json = _user_folders_json(request.user)
 
     return render(
         request,
@@ -232,6 +460,8 @@ def note_create(request):
 
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_user_notes_etag)
 def note_edit(request, pk):
     note = get_object_or_404(Note, pk=pk, user=request.user)
 
@@ -255,81 +485,60 @@ def note_edit(request, pk):
         if (is_ajax_update and final_content) or (title and final_content):
             # Handle image upload
             if image:
-                import os
-                from django.conf import settings
-
-                # Create media directory if it doesn't exist
-                media_dir = os.path.join(settings.MEDIA_ROOT, "note_images")
-                os.makedirs(media_dir, exist_ok=True)
-
-                # Save the image
-                image_path = os.path.join(media_dir, image.name)
-                with open(image_path, "wb+") as destination:
-                    for chunk in image.chunks():
-                        destination.write(chunk)
-
-            # Save current version to history before updating (only for non-AJAX updates)
-            if not is_ajax_update:
-                NoteVersion.objects.create(
-                    note=note,
-                    title=note.title,
-                    content=note.content,
-                    is_locked=note.is_locked,
-                    salt=note.salt,
-                )
-
-            # Update note
-            if not is_ajax_update and title:
-                note.title = title
-            note.content = final_content
-            note.is_locked = is_locked
-            note.salt = salt
+                _save_note_image(image)
+
+            # Update the note with the row locked so concurrent autosaves cannot
+            # lose each other's changes
+            with transaction.atomic():
+                note = Note.objects.select_for_update().get(pk=note.pk)
+
+                # Save current version to history before updating (only for
+                # non-AJAX updates that change something). The snapshot is taken
+                # under the lock but written after commit, outside the lock window.
+                new_title = title if title else note.title
+                if not is_ajax_update and (
+                    note.title != new_title or note.content != final_content
+                ):
+                    transaction.on_commit(
+                        partial(
+                            NoteVersion.objects.create,
+                            note_id=note.pk,
+                            title=note.title,
+                            content=note.content,
+                            is_locked=note.is_locked,
+                            salt=note.salt,
+                        )
+                    )
 
-            # Update folder if specified (only for non-AJAX updates)
-            if not is_ajax_update:
-                if folder_id:
-                    try:
-                        folder = Folder.objects.get(id=folder_id, user=request.user)
-                        note.folder = folder
-                    except Folder.DoesNotExist:
+                # Update note
+                if not is_ajax_update and title:
+                    note.title = title
+                note.content = final_content
+                note.is_locked = is_locked
+                note.salt = salt
+                update_fields = ["content", "is_locked", "salt", "updated_at"]
+
+                # Update folder if specified (only for non-AJAX updates)
+                if not is_ajax_update:
+                    update_fields += ["title", "folder"]
+                    if folder_id:
+                        note.folder = Folder.objects.filter(
+                            id=folder_id, user=request.user
+                        ).first()
+                    elif folder_id == "":  # Empty string means remove folder
                         note.folder = None
-                elif folder_id == "":  # Empty string means remove folder
-                    note.folder = None
 
-            note.save()
+                note.save(update_fields=update_fields)
+
+                # Process tags (only for non-AJAX updates) in the same
+                # transaction, so an edit commits once and applies fully or not at all
+                if not is_ajax_update:
+                    _sync_note_tags(request.user, note, tags_data)
 
             # Check if this is an AJAX request for checkbox update
             if is_ajax_update:
                 return JsonResponse({"success": True})
 
-            # Process tags (only for non-AJAX updates)
-            note.tags.clear()  # Remove existing tags
-            if tags_data:
-                import json
-
-                try:
-                    tags_list = json.loads(tags_data)
-                    for tag_data in tags_list:
-                        tag_name = tag_data.get("name", "").strip()
-                        tag_color = tag_data.get("color", "#3b82f6")
-                        if tag_name:
-                            # Get or create tag (case-insensitive)
-                            try:
-                                tag = Tag.objects.get(
-                                    user=request.user, name__iexact=tag_name
-                                )
-                                # Update color if changed
-                                if tag.color != tag_color:
-                                    tag.color = tag_color
-                                    tag.save()
-                            except Tag.DoesNotExist:
-                                tag = Tag.objects.create(
-                                    user=request.user, name=tag_name, color=tag_color
-                                )
-                            note.tags.add(tag)
-                except (json.JSONDecodeError, ValueError):
-                    pass
-
             messages.success(request, "Note updated successfully!")
             return redirect("note_view", pk=pk)
         else:
@@ -340,18 +549,7 @@ def note_edit(request, pk):
     folders = Folder.objects.filter(user=request.user)
 
     # Serialize folders for JavaScript
-    import json
-
-    folders_json = json.dumps(
-        [
-            {
-                "id": folder.id,
-                "name": folder.name,
-                "parent_id": folder.parent.id if folder.parent else None,
-            }
-            for folder in folders
-        ]
-    )
+    folders_json = _user_folders_json(request.user)
 
     return render(
         request,
@@ -411,22 +609,57 @@ def note_unlock(request, pk):
     return render(request, "notes/note_unlock.html", {"note": note})
 
 
+def _canvas_elements_json(elements):
+    """Serialize a canvas element queryset to JSON without building instances"""
+    rows = elements.values(*elements.model.SERIALIZED_FIELDS)
+    return _json_dumps([elements.model.serialize_row(row) for row in rows])
+
+
+def _note_history_etag(request, pk):
+    """ETag of a note's history page: the note's last change and newest version.
+
+    Microsecond timestamps tell apart autosaves landing in the same second,
+    which a one-second Last-Modified would not.
+    """
+    if request.method != "GET" or len(messages.get_messages(request)):
+        return None
+    row = (
+        Note.objects.filter(pk=pk, user=request.user)
+        .annotate(latest_version=Max("versions__id"))
+        .values_list("updated_at", "latest_version")
+        .first()
+    )
+    if row is None:
+        return None
+    updated_at, latest_version = row
+    return f"{updated_at.isoformat()}-{latest_version or 0}"
+
+
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_user_notes_etag)
 def note_view(request, pk):
     note = get_object_or_404(Note, pk=pk, user=request.user)
 
-    # Get all notes for the sidebar
-    all_notes = Note.objects.filter(user=request.user).order_by("-updated_at")
+    # Get the most recent notes for the sidebar (skip loading their content).
+    # Saved notes drop the cached list; canvas edits only bump updated_at in
+    # place, so their reordering shows up once the entry expires.
+    all_notes = cache.get_or_set(
+        sidebar_notes_key(request.user.pk),
+        lambda: list(
+            Note.objects.filter(user=request.user)
+            .values("pk", "title", "note_type", "is_locked", "updated_at")
+            .order_by("-updated_at")[:100]
+        ),
+        SIDEBAR_NOTES_TIMEOUT,
+    )
 
     # For canvas notes, get elements as JSON
     elements_json = "[]"
     if note.note_type == "canvas":
-        import json
-        from .models import CanvasElement
-
         # Exclude soft-deleted elements
         elements = CanvasElement.objects.filter(note=note, deleted=False)
-        elements_json = json.dumps([element.to_dict() for element in elements])
+        elements_json = _canvas_elements_json(elements)
 
     # Build breadcrumb path
     breadcrumb_path = []
@@ -457,17 +690,43 @@ def note_view(request, pk):
 
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_note_history_etag)
 def note_history(request, pk):
     note = get_object_or_404(Note, pk=pk, user=request.user)
 
     # Get all versions for this note
-    # Exclude any versions that have the same content as the current note to avoid duplicates
-    versions = NoteVersion.objects.filter(note=note).exclude(
-        title=note.title, content=note.content
+    # Exclude any versions that have the same content as the current note to avoid
+    # duplicates (compared by digest rather than the full content; rows written
+    # before the digest existed fall back to comparing the text)
+    versions = (
+        NoteVersion.objects.filter(note=note)
+        .exclude(
+            Q(content_hash=content_digest(note.content))
+            | Q(content_hash="", content=note.content),
+            title=note.title,
+        )
+        .order_by("-id")
     )
+    # Show one page at a time; older pages are loaded with ?before=<version id>
+    before = request.GET.get("before")
+    if before:
+        try:
+            versions = versions.filter(id__lt=int(before))
+        except ValueError:
+            pass
+
+    versions = list(versions[: HISTORY_PAGE_SIZE + 1])
+    has_older = len(versions) > HISTORY_PAGE_SIZE
 
     return render(
-        request, "notes/note_history.html", {"note": note, "versions": versions}
+        request,
+        "notes/note_history.html",
+        {
+            "note": note,
+            "versions": versions[:HISTORY_PAGE_SIZE],
+            "has_older": has_older,
+        },
     )
 
 
@@ -475,16 +734,16 @@ def note_history(request, pk):
 def render_markdown(request):
     """Render markdown content using the same filter as server-side rendering"""
     if request.method == "POST":
-        from .templatetags.markdown_extras import markdown_format
-        from django.http import HttpResponse
-
         content = request.POST.get("content", "")
-        rendered_html = markdown_format(content)
+        # The editor re-posts mostly unchanged content, so reuse earlier renders
+        rendered_html = cache.get_or_set(
+            f"markdown:{content_digest(content)}",
+            lambda: markdown_format(content),
+            MARKDOWN_CACHE_TIMEOUT,
+        )
 
         return HttpResponse(rendered_html, content_type="text/html")
 
-    from django.http import HttpResponseNotAllowed
-
     return HttpResponseNotAllowed(["POST"])
 
 
@@ -525,16 +784,22 @@ def profile(request):
 @login_required
 def tag_autocomplete(request):
     """API endpoint for tag autocomplete"""
-    query = request.GET.get("q", "").strip()
+    query = request.GET.get("q", "").strip().lower()
 
-    if not query:
-        tags = Tag.objects.filter(user=request.user)[:20]
-    else:
-        # Case-insensitive search
-        tags = Tag.objects.filter(user=request.user, name__icontains=query)[:20]
+    # The user's tags are cached and matched here rather than queried per keystroke
+    tags = cache.get_or_set(
+        user_tags_key(request.user.pk),
+        lambda: list(
+            Tag.objects.filter(user=request.user).values("id", "name", "color")
+        ),
+        USER_TAGS_TIMEOUT,
+    )
 
-    results = [{"id": tag.id, "name": tag.name, "color": tag.color} for tag in tags]
-    return JsonResponse({"results": results})
+    # Case-insensitive search
+    results = [tag for tag in tags if query in tag["name"].lower()][:20]
+    return HttpResponse(
+        _json_dumps({"results": results}), content_type="application/json"
+    )
 
 
 # Friends system views
@@ -548,29 +813,47 @@ def search_users(request):
 
     if query:
         # Search by username or email (case-insensitive)
-        users = CustomUser.objects.filter(
-            Q(username__icontains=query) | Q(email__icontains=query)
-        ).exclude(id=request.user.id)[:20]
+        users = list(
+            CustomUser.objects.filter(
+                Q(username__icontains=query) | Q(email__icontains=query)
+            ).exclude(id=request.user.id)[:20]
+        )
+        user_ids = [user.id for user in users]
+
+        # Fetch friend status for all found users at once
+        friend_ids = set()
+        for user1_id, user2_id in Friendship.objects.filter(
+            Q(user1=request.user, user2_id__in=user_ids)
+            | Q(user2=request.user, user1_id__in=user_ids)
+        ).values_list("user1_id", "user2_id"):
+            friend_ids.add(user2_id if user1_id == request.user.id else user1_id)
+
+        # Pending requests in either direction, keyed by the other user
+        pending_requests = {}
+        for friend_request in FriendRequest.objects.filter(
+            Q(from_user=request.user, to_user_id__in=user_ids)
+            | Q(from_user_id__in=user_ids, to_user=request.user),
+            status="pending",
+        ):
+            other_id = (
+                friend_request.to_user_id
+                if friend_request.from_user_id == request.user.id
+                else friend_request.from_user_id
+            )
+            pending_requests[other_id] = friend_request
 
-        # Check friend status for each user
         for user in users:
-            is_friend = Friendship.are_friends(request.user, user)
-
-            # Check if there's a pending request
-            pending_request = FriendRequest.objects.filter(
-                Q(from_user=request.user, to_user=user, status="pending")
-                | Q(from_user=user, to_user=request.user, status="pending")
-            ).first()
+            pending_request = pending_requests.get(user.id)
 
             results.append(
                 {
                     "id": user.id,
                     "username": user.username,
                     "email": user.email,
-                    "is_friend": is_friend,
+                    "is_friend": user.id in friend_ids,
                     "pending_request": pending_request.id if pending_request else None,
                     "pending_from_me": (
-                        pending_request.from_user == request.user
+                        pending_request.from_user_id == request.user.id
                         if pending_request
                         else False
                     ),
@@ -592,7 +875,7 @@ def send_friend_request(request, user_id):
         return redirect("search_users")
 
     # Check if already friends
-    if Friendship.are_friends(request.user, to_user):
+    if to_user.id in _friend_ids(request.user):
         messages.info(request, f"You are already friends with {to_user.username}.")
         return redirect("friends_list")
 
@@ -657,13 +940,14 @@ def reject_friend_request(request, request_id):
 @login_required
 def friends_list(request):
     """Display list of friends and pending friend requests"""
-    friends = Friendship.get_friends(request.user)
+    # Streamed straight into the template, which walks the list once
+    friends = Friendship.get_friends(request.user).only("id", "username", "email")
     pending_requests = FriendRequest.objects.filter(
         to_user=request.user, status="pending"
-    )
+    ).select_related("from_user")
     sent_requests = FriendRequest.objects.filter(
         from_user=request.user, status="pending"
-    )
+    ).select_related("to_user")
 
     return render(
         request,
@@ -682,7 +966,7 @@ def friend_chat(request, friend_id):
     friend = get_object_or_404(CustomUser, id=friend_id)
 
     # Verify friendship
-    if not Friendship.are_friends(request.user, friend):
+    if friend.id not in _friend_ids(request.user):
         messages.error(request, "You can only chat with friends.")
         return redirect("friends_list")
 
@@ -695,11 +979,26 @@ def friend_chat(request, friend_id):
             )
             return redirect("friend_chat", friend_id=friend_id)
 
-    # Get all messages between the two users
-    chat_messages = ChatMessage.objects.filter(
-        Q(from_user=request.user, to_user=friend)
-        | Q(from_user=friend, to_user=request.user)
-    ).order_by("created_at")
+    # Get the latest page of messages between the two users. Older pages are
+    # loaded with ?before=<message id> (keyset pagination, no OFFSET scans).
+    chat_messages = (
+        ChatMessage.objects.filter(
+            Q(from_user=request.user, to_user=friend)
+            | Q(from_user=friend, to_user=request.user)
+        )
+        .only("id", "message", "created_at", "from_user_id")
+        .order_by("-id")
+    )
+    before = request.GET.get("before")
+    if before:
+        try:
+            chat_messages = chat_messages.filter(id__lt=int(before))
+        except ValueError:
+            pass
+
+    chat_messages = list(chat_messages[: CHAT_PAGE_SIZE + 1])
+    has_earlier = len(chat_messages) > CHAT_PAGE_SIZE
+    chat_messages = chat_messages[:CHAT_PAGE_SIZE][::-1]
 
     return render(
         request,
@@ -707,6 +1006,7 @@ def friend_chat(request, friend_id):
         {
             "friend": friend,
             "chat_messages": chat_messages,
+            "has_earlier": has_earlier,
         },
     )
 
@@ -717,15 +1017,25 @@ def shared_notes_list(request, friend_id):
     friend = get_object_or_404(CustomUser, id=friend_id)
 
     # Verify friendship
-    if not Friendship.are_friends(request.user, friend):
+    if friend.id not in _friend_ids(request.user):
         messages.error(request, "You can only view shared notes with friends.")
         return redirect("friends_list")
 
     # Get shared notes (both directions)
-    shared_notes = SharedNote.objects.filter(
-        Q(user1=request.user, user2=friend) | Q(user1=friend, user2=request.user)
+    shared_notes = (
+        SharedNote.objects.filter(**_pair_filter(request.user, friend))
+        .select_related("folder", "created_by")
+        .prefetch_related("tags")
+        .defer("content")
+        .annotate(preview=Substr("content", 1, NOTE_PREVIEW_LENGTH))
     )
 
+    # Get all shared folders for this friendship; the current folder and its
+    # subfolders are picked from the same (cached) rows
+    shared_folders = SharedFolder.objects.filter(
+        **_pair_filter(request.user, friend)
+    ).select_related("parent")
+
     # Filter by folder if specified
     folder_id = request.GET.get("folder")
     current_folder = None
@@ -733,49 +1043,28 @@ def shared_notes_list(request, friend_id):
         # Don't filter by folder, show all shared notes
         pass
     elif folder_id:
-        try:
-            current_folder = SharedFolder.objects.get(id=folder_id)
-            if not current_folder.has_access(request.user):
-                messages.error(request, "Access denied to folder")
-                return redirect("shared_notes_list", friend_id=friend_id)
+        current_folder = _folder_from_param(shared_folders, folder_id)
+        if current_folder:
             shared_notes = shared_notes.filter(folder=current_folder)
-        except SharedFolder.DoesNotExist:
-            pass
+        elif folder_id.isdigit() and SharedFolder.objects.filter(id=folder_id).exists():
+            # The folder belongs to another friendship
+            messages.error(request, "Access denied to folder")
+            return redirect("shared_notes_list", friend_id=friend_id)
     else:  # Default to Home (no folder) when no folder parameter or empty string
         shared_notes = shared_notes.filter(folder__isnull=True)
 
-    # Get all shared folders for this friendship
-    shared_folders = SharedFolder.objects.filter(
-        Q(user1=request.user, user2=friend) | Q(user1=friend, user2=request.user)
-    )
-
     # Get subfolders for the current folder if viewing a specific folder
     # For Home view (no current folder), show root-level folders
     subfolders = []
-    if current_folder:
-        subfolders = SharedFolder.objects.filter(
-            Q(user1=request.user, user2=friend) | Q(user1=friend, user2=request.user),
-            parent=current_folder,
-        ).order_by("name")
-    elif folder_id != "all":  # Home view - show root folders
-        subfolders = SharedFolder.objects.filter(
-            Q(user1=request.user, user2=friend) | Q(user1=friend, user2=request.user),
-            parent__isnull=True,
-        ).order_by("name")
+    if current_folder or folder_id != "all":
+        parent_id = current_folder.id if current_folder else None
+        subfolders = sorted(
+            (f for f in shared_folders if f.parent_id == parent_id),
+            key=lambda f: f.name,
+        )
 
     # Serialize folders for JavaScript
-    import json
-
-    shared_folders_json = json.dumps(
-        [
-            {
-                "id": folder.id,
-                "name": folder.name,
-                "parent_id": folder.parent.id if folder.parent else None,
-            }
-            for folder in shared_folders
-        ]
-    )
+    shared_folders_json = _folders_json(shared_folders)
 
     return render(
         request,
@@ -797,7 +1086,7 @@ def shared_note_create(request, friend_id):
     friend = get_object_or_404(CustomUser, id=friend_id)
 
     # Verify friendship
-    if not Friendship.are_friends(request.user, friend):
+    if friend.id not in _friend_ids(request.user):
         messages.error(request, "You can only create shared notes with friends.")
         return redirect("friends_list")
 
@@ -841,42 +1130,17 @@ def shared_note_create(request, friend_id):
 
             # Assign folder if specified
             if folder_id:
-                try:
-                    folder = SharedFolder.objects.get(id=folder_id)
-                    if folder.has_access(request.user):
-                        shared_note.folder = folder
-                except SharedFolder.DoesNotExist:
-                    pass
-
-            shared_note.save()
+                folder = SharedFolder.objects.filter(id=folder_id).first()
+                if folder and folder.has_access(request.user):
+                    shared_note.folder = folder
 
-            # Process tags (only for markdown notes)
-            if note_type == "markdown" and tags_data:
-                import json
+            with transaction.atomic():
+                shared_note.save()
 
-                try:
-                    tags_list = json.loads(tags_data)
-                    for tag_data in tags_list:
-                        tag_name = tag_data.get("name", "").strip()
-                        tag_color = tag_data.get("color", "#3b82f6")
-                        if tag_name:
-                            # Get or create tag (case-insensitive)
-                            # Tags can be shared between users via shared notes
-                            try:
-                                tag = Tag.objects.get(
-                                    user=request.user, name__iexact=tag_name
-                                )
-                                # Update color if changed
-                                if tag.color != tag_color:
-                                    tag.color = tag_color
-                                    tag.save()
-                            except Tag.DoesNotExist:
-                                tag = Tag.objects.create(
-                                    user=request.user, name=tag_name, color=tag_color
-                                )
-                            shared_note.tags.add(tag)
-                except (json.JSONDecodeError, ValueError):
-                    pass
+                # Process tags (only for markdown notes)
+                # Tags can be shared between users via shared notes
+                if note_type == "markdown" and tags_data:
+                    _sync_note_tags(request.user, shared_note, tags_data)
 
             messages.success(request, "Shared note created successfully!")
             return redirect("shared_note_view", note_id=shared_note.id)
@@ -884,42 +1148,16 @@ def shared_note_create(request, friend_id):
             messages.error(request, "Title is required.")
 
     # Get tags that are used in shared notes with this friend
-    user_tags = Tag.objects.filter(
-        Q(user=request.user) | Q(user=friend),
-        shared_notes__in=SharedNote.objects.filter(
-            Q(user1=request.user, user2=friend) | Q(user1=friend, user2=request.user)
-        ),
-    ).distinct()
+    user_tags = _shared_pair_tags(request.user, friend)
 
     # Get shared folders for this friendship
-    shared_folders = SharedFolder.objects.filter(
-        Q(user1=request.user, user2=friend) | Q(user1=friend, user2=request.user)
-    )
+    shared_folders = SharedFolder.objects.filter(**_pair_filter(request.user, friend))
 
     # Get current folder from query param if provided
-    current_folder_id = request.GET.get("folder")
-    current_folder = None
-    if current_folder_id:
-        try:
-            current_folder = SharedFolder.objects.get(id=current_folder_id)
-            if not current_folder.has_access(request.user):
-                current_folder = None
-        except SharedFolder.DoesNotExist:
-            pass
+    current_folder = _folder_from_param(shared_folders, request.GET.get("folder"))
 
     # Serialize folders for JavaScript
-    import json
-
-    shared_folders_json = json.dumps(
-        [
-            {
-                "id": folder.id,
-                "name": folder.name,
-                "parent_id": folder.parent.id if folder.parent else None,
-            }
-            for folder in shared_folders
-        ]
-    )
+    shared_folders_json = _folders_json(shared_folders)
 
     return render(
         request,
@@ -937,7 +1175,12 @@ def shared_note_create(request, friend_id):
 @login_required
 def shared_note_view(request, note_id):
     """View a shared note"""
-    shared_note = get_object_or_404(SharedNote, id=note_id)
+    shared_note = get_object_or_404(
+        SharedNote.objects.select_related(
+            "user1", "user2", "created_by", "folder"
+        ).prefetch_related("tags"),
+        id=note_id,
+    )
 
     # Verify access
     if not shared_note.has_access(request.user):
@@ -948,19 +1191,13 @@ def shared_note_view(request, note_id):
     friend = (
         shared_note.user2 if shared_note.user1 == request.user else shared_note.user1
     )
-    all_notes = SharedNote.objects.filter(
-        Q(user1=request.user, user2=friend) | Q(user1=friend, user2=request.user)
-    ).order_by("-updated_at")
 
     # For canvas notes, get elements as JSON
     elements_json = "[]"
     if shared_note.note_type == "canvas":
-        import json
-        from .models import CanvasElement
-
         # Exclude soft-deleted elements
         elements = CanvasElement.objects.filter(shared_note=shared_note, deleted=False)
-        elements_json = json.dumps([element.to_dict() for element in elements])
+        elements_json = _canvas_elements_json(elements)
 
     # Build breadcrumb path
     breadcrumb_path = []
@@ -982,7 +1219,6 @@ def shared_note_view(request, note_id):
         "notes/shared_note_view.html",
         {
             "shared_note": shared_note,
-            "all_notes": all_notes,
             "friend": friend,
             "elements_json": elements_json,
             "breadcrumb_path": breadcrumb_path,
@@ -990,9 +1226,43 @@ def shared_note_view(request, note_id):
     )
 
 
+def _shared_note_ajax_update(request, note_id):
+    """Apply an AJAX checkbox update to a shared note with a single UPDATE
+
+    Returns None when the request carries no content, so the caller can fall
+    back to the regular edit handling.
+    """
+    final_content = request.POST.get("encrypted_content") or request.POST.get("content")
+    if not final_content:
+        return None
+
+    notes = SharedNote.objects.filter(id=note_id)
+    users = notes.values("user1_id", "user2_id").first()
+    if users is None:
+        raise Http404("Shared note not found")
+    if request.user.id not in (users["user1_id"], users["user2_id"]):
+        messages.error(request, "You don't have access to this note.")
+        return redirect("friends_list")
+
+    fields = {
+        "content": final_content,
+        "is_locked": request.POST.get("is_locked") == "on",
+        "updated_at": timezone.now(),
+    }
+    if "salt" in request.POST:
+        fields["salt"] = request.POST["salt"]
+    notes.update(**fields)
+    return JsonResponse({"success": True})
+
+
 @login_required
 def shared_note_edit(request, note_id):
     """Edit a shared note"""
+    if request.method == "POST" and request.POST.get("ajax_update") == "true":
+        response = _shared_note_ajax_update(request, note_id)
+        if response:
+            return response
+
     shared_note = get_object_or_404(SharedNote, id=note_id)
 
     # Verify access
@@ -1026,9 +1296,11 @@ def shared_note_edit(request, note_id):
             shared_note.content = final_content
             shared_note.is_locked = is_locked
             shared_note.salt = salt
+            update_fields = ["content", "is_locked", "salt", "updated_at"]
 
             # Update folder if specified (only for non-AJAX updates)
             if not is_ajax_update:
+                update_fields += ["title", "folder"]
                 if folder_id:
                     try:
                         folder = SharedFolder.objects.get(id=folder_id)
@@ -1039,70 +1311,30 @@ def shared_note_edit(request, note_id):
                 elif folder_id == "":  # Empty string means remove folder
                     shared_note.folder = None
 
-            shared_note.save()
+            with transaction.atomic():
+                shared_note.save(update_fields=update_fields)
+
+                # Process tags (only for non-AJAX updates) in the same
+                # transaction, so an edit applies fully or not at all
+                if not is_ajax_update:
+                    _sync_note_tags(request.user, shared_note, tags_data)
 
             # Check if this is an AJAX request for checkbox update
             if is_ajax_update:
                 return JsonResponse({"success": True})
 
-            # Process tags (only for non-AJAX updates)
-            shared_note.tags.clear()  # Remove existing tags
-            if tags_data:
-                import json
-
-                try:
-                    tags_list = json.loads(tags_data)
-                    for tag_data in tags_list:
-                        tag_name = tag_data.get("name", "").strip()
-                        tag_color = tag_data.get("color", "#3b82f6")
-                        if tag_name:
-                            # Get or create tag (case-insensitive)
-                            try:
-                                tag = Tag.objects.get(
-                                    user=request.user, name__iexact=tag_name
-                                )
-                                # Update color if changed
-                                if tag.color != tag_color:
-                                    tag.color = tag_color
-                                    tag.save()
-                            except Tag.DoesNotExist:
-                                tag = Tag.objects.create(
-                                    user=request.user, name=tag_name, color=tag_color
-                                )
-                            shared_note.tags.add(tag)
-                except (json.JSONDecodeError, ValueError):
-                    pass
-
             messages.success(request, "Shared note updated successfully!")
             return redirect("shared_note_view", note_id=note_id)
         else:
             messages.error(request, "Title and content are required.")
     # find all tags that have shared notes between the two users, meaning tags that are present in at least one of their shared notes
-    user_tags = Tag.objects.filter(
-        Q(user=request.user) | Q(user=friend),
-        shared_notes__in=SharedNote.objects.filter(
-            Q(user1=request.user, user2=friend) | Q(user1=friend, user2=request.user)
-        ),
-    ).distinct()
+    user_tags = _shared_pair_tags(request.user, friend)
 
     # Get shared folders for this friendship
-    shared_folders = SharedFolder.objects.filter(
-        Q(user1=request.user, user2=friend) | Q(user1=friend, user2=request.user)
-    )
+    shared_folders = SharedFolder.objects.filter(**_pair_filter(request.user, friend))
 
     # Serialize folders for JavaScript
-    import json
-
-    shared_folders_json = json.dumps(
-        [
-            {
-                "id": folder.id,
-                "name": folder.name,
-                "parent_id": folder.parent.id if folder.parent else None,
-            }
-            for folder in shared_folders
-        ]
-    )
+    shared_folders_json = _folders_json(shared_folders)
 
     return render(
         request,
@@ -1163,26 +1395,30 @@ def folder_create(request):
         parent = None
         if parent_id:
             try:
-                parent = Folder.objects.get(id=parent_id, user=request.user)
+                parent = Folder.objects.only("id").get(id=parent_id, user=request.user)
             except Folder.DoesNotExist:
                 return JsonResponse(
                     {"success": False, "error": "Parent folder not found"}
                 )
 
-        # Check if folder with same name already exists in parent
-        if Folder.objects.filter(user=request.user, name=name, parent=parent).exists():
+        # Names are unique within a parent; the database enforces it
+        try:
+            with transaction.atomic():
+                folder = Folder.objects.create(
+                    user=request.user, name=name, parent=parent
+                )
+        except IntegrityError:
             return JsonResponse(
                 {"success": False, "error": "A folder with this name already exists"}
             )
 
-        folder = Folder.objects.create(user=request.user, name=name, parent=parent)
         return JsonResponse(
             {
                 "success": True,
                 "folder": {
                     "id": folder.id,
                     "name": folder.name,
-                    "parent_id": folder.parent.id if folder.parent else None,
+                    "parent_id": folder.parent_id,
                 },
             }
         )
@@ -1201,20 +1437,16 @@ def folder_rename(request, folder_id):
         if not new_name:
             return JsonResponse({"success": False, "error": "Folder name is required"})
 
-        # Check if folder with same name already exists in parent
-        if (
-            Folder.objects.filter(
-                user=request.user, name=new_name, parent=folder.parent
-            )
-            .exclude(id=folder.id)
-            .exists()
-        ):
+        # Names are unique within a parent; the database enforces it
+        folder.name = new_name
+        try:
+            with transaction.atomic():
+                folder.save(update_fields=["name", "updated_at"])
+        except IntegrityError:
             return JsonResponse(
                 {"success": False, "error": "A folder with this name already exists"}
             )
 
-        folder.name = new_name
-        folder.save()
         return JsonResponse(
             {"success": True, "folder": {"id": folder.id, "name": folder.name}}
         )
@@ -1228,13 +1460,15 @@ def folder_delete(request, folder_id):
     folder = get_object_or_404(Folder, id=folder_id, user=request.user)
 
     if request.method == "POST":
-        # Move all notes to parent folder (or None if root folder)
-        Note.objects.filter(folder=folder).update(folder=folder.parent)
+        # Re-home the contents and delete the folder in one transaction
+        with transaction.atomic():
+            # Move all notes to parent folder (or None if root folder)
+            Note.objects.filter(folder=folder).update(folder_id=folder.parent_id)
 
-        # Move all subfolders to parent folder (or None if root folder)
-        Folder.objects.filter(parent=folder).update(parent=folder.parent)
+            # Move all subfolders to parent folder (or None if root folder)
+            Folder.objects.filter(parent=folder).update(parent_id=folder.parent_id)
 
-        folder.delete()
+            folder.delete()
         messages.success(request, f"Folder '{folder.name}' deleted successfully!")
         return redirect("note_list")
 
@@ -1272,7 +1506,7 @@ def shared_folder_create(request, friend_id):
     """Create a new shared folder with a friend"""
     friend = get_object_or_404(CustomUser, id=friend_id)
 
-    if not Friendship.are_friends(request.user, friend):
+    if friend.id not in _friend_ids(request.user):
         return JsonResponse(
             {
                 "success": False,
@@ -1290,7 +1524,9 @@ def shared_folder_create(request, friend_id):
         parent = None
         if parent_id:
             try:
-                parent = SharedFolder.objects.get(id=parent_id)
+                parent = SharedFolder.objects.only("id", "user1", "user2").get(
+                    id=parent_id
+                )
                 if not parent.has_access(request.user):
                     return JsonResponse(
                         {"success": False, "error": "Access denied to parent folder"}
@@ -1303,24 +1539,24 @@ def shared_folder_create(request, friend_id):
         # Ensure consistent user ordering
         user1, user2 = sorted([request.user, friend], key=lambda u: u.id)
 
-        # Check if folder with same name already exists in parent
-        if SharedFolder.objects.filter(
-            user1=user1, user2=user2, name=name, parent=parent
-        ).exists():
+        # Names are unique within a parent; the database enforces it
+        try:
+            with transaction.atomic():
+                folder = SharedFolder.objects.create(
+                    user1=user1, user2=user2, name=name, parent=parent
+                )
+        except IntegrityError:
             return JsonResponse(
                 {"success": False, "error": "A folder with this name already exists"}
             )
 
-        folder = SharedFolder.objects.create(
-            user1=user1, user2=user2, name=name, parent=parent
-        )
         return JsonResponse(
             {
                 "success": True,
                 "folder": {
                     "id": folder.id,
                     "name": folder.name,
-                    "parent_id": folder.parent.id if folder.parent else None,
+                    "parent_id": folder.parent_id,
                 },
             }
         )
@@ -1342,23 +1578,16 @@ def shared_folder_rename(request, folder_id):
         if not new_name:
             return JsonResponse({"success": False, "error": "Folder name is required"})
 
-        # Check if folder with same name already exists in parent
-        if (
-            SharedFolder.objects.filter(
-                user1=folder.user1,
-                user2=folder.user2,
-                name=new_name,
-                parent=folder.parent,
-            )
-            .exclude(id=folder.id)
-            .exists()
-        ):
+        # Names are unique within a parent; the database enforces it
+        folder.name = new_name
+        try:
+            with transaction.atomic():
+                folder.save(update_fields=["name", "updated_at"])
+        except IntegrityError:
             return JsonResponse(
                 {"success": False, "error": "A folder with this name already exists"}
             )
 
-        folder.name = new_name
-        folder.save()
         return JsonResponse(
             {"success": True, "folder": {"id": folder.id, "name": folder.name}}
         )
@@ -1378,13 +1607,17 @@ def shared_folder_delete(request, folder_id):
     friend = folder.user2 if folder.user1 == request.user else folder.user1
 
     if request.method == "POST":
-        # Move all notes to parent folder (or None if root folder)
-        SharedNote.objects.filter(folder=folder).update(folder=folder.parent)
-
-        # Move all subfolders to parent folder (or None if root folder)
-        SharedFolder.objects.filter(parent=folder).update(parent=folder.parent)
+        # Re-home the contents and delete the folder in one transaction
+        with transaction.atomic():
+            # Move all notes to parent folder (or None if root folder)
+            SharedNote.objects.filter(folder=folder).update(folder_id=folder.parent_id)
+
+            # Move all subfolders to parent folder (or None if root folder)
+            SharedFolder.objects.filter(parent=folder).update(
+                parent_id=folder.parent_id
+            )
 
-        folder.delete()
+            folder.delete()
         messages.success(request, f"Folder '{folder.name}' deleted successfully!")
         return redirect("shared_notes_list", friend_id=friend.id)
 
@@ -1428,15 +1661,50 @@ def shared_note_move(request, note_id):
 # Canvas element management views
 
 
+def _get_canvas_element(user, element_id):
+    """Fetch a canvas element annotated with whether the user may change it
+
+    Access comes from owning the element's note or being part of its shared
+    note, and is resolved in the same query as the element itself.
+    """
+    elements = CanvasElement.objects.annotate(
+        user_has_access=Case(
+            When(
+                Q(note__user=user)
+                | Q(shared_note__user1=user)
+                | Q(shared_note__user2=user),
+                then=Value(True),
+            ),
+            default=Value(False),
+            output_field=BooleanField(),
+        )
+    )
+    return get_object_or_404(elements, id=element_id)
+
+
+def _element_response(element):
+    """JSON success response carrying a canvas element, encoded with _json_dumps"""
+    return HttpResponse(
+        _json_dumps({"success": True, "element": element.to_dict()}),
+        content_type="application/json",
+    )
+
+
+def _touch_canvas_parent(element):
+    """Bump updated_at on an element's note without rewriting the note row"""
+    now = timezone.now()
+    if element.note_id:
+        Note.objects.filter(pk=element.note_id).update(updated_at=now)
+    elif element.shared_note_id:
+        SharedNote.objects.filter(pk=element.shared_note_id).update(updated_at=now)
+
+
 @login_required
 def canvas_element_create(request):
     """Create a new canvas element"""
     if request.method == "POST":
-        import json
-        from .models import CanvasElement
-
         try:
-            data = json.loads(request.body)
+            data = _json_loads(request.body)
 
             element_type = data.get("element_type")
             note_id = data.get("note_id")
@@ -1570,13 +1838,11 @@ def canvas_element_create(request):
                 )
 
             element.save()
+            _touch_canvas_parent(element)
 
-            return JsonResponse({"success": True, "element": element.to_dict()})
+            return _element_response(element)
         except Exception as e:
             # Log the error for debugging but don't expose stack trace to user
-            import logging
-
-            logger = logging.getLogger(__name__)
             logger.error(f"Error creating canvas element: {str(e)}", exc_info=True)
             return JsonResponse({"success": False, "error": "Failed to create element"})
 
@@ -1587,37 +1853,27 @@ def canvas_element_create(request):
 def canvas_element_update(request, element_id):
     """Update a canvas element"""
     if request.method == "POST":
-        import json
-        from .models import CanvasElement
-
         try:
-            element = get_object_or_404(CanvasElement, id=element_id)
+            element = _get_canvas_element(request.user, element_id)
 
             # Verify access
-            if element.note:
-                if element.note.user != request.user:
-                    return JsonResponse({"success": False, "error": "Access denied"})
-            elif element.shared_note:
-                if not element.shared_note.has_access(request.user):
-                    return JsonResponse({"success": False, "error": "Access denied"})
+            if not element.user_has_access:
+                return JsonResponse({"success": False, "error": "Access denied"})
 
-            data = json.loads(request.body)
+            data = _json_loads(request.body)
+            # Only the columns touched below are written back
+            dirty = {"updated_at"}
 
             # Update position and size
-            if "x" in data:
-                element.x = data["x"]
-            if "y" in data:
-                element.y = data["y"]
-            if "width" in data:
-                element.width = data["width"]
-            if "height" in data:
-                element.height = data["height"]
-            if "z_index" in data:
-                element.z_index = data["z_index"]
+            for field in ("x", "y", "width", "height", "z_index"):
+                if field in data:
+                    setattr(element, field, data[field])
+                    dirty.add(field)
 
             # Update content for textbox
             if element.element_type == "textbox" and "text_content" in data:
                 element.text_content = data["text_content"]
+                dirty.add("text_content")
 
             # Update styling for shapes/freehand
             if element.element_type in ["rectangle", "circle", "line", "freehand"]:
@@ -1644,28 +1900,25 @@ def canvas_element_update(request, element_id):
 
                 if "stroke_color" in data:
                     element.stroke_color = _sanitize_color(data.get("stroke_color"))
+                    dirty.add("stroke_color")
                 if "fill_color" in data:
                     element.fill_color = _sanitize_color(data.get("fill_color"))
+                    dirty.add("fill_color")
                 if "stroke_width" in data:
                     try:
                         element.stroke_width = int(data.get("stroke_width"))
+                        dirty.add("stroke_width")
                     except (TypeError, ValueError):
                         pass
 
-            element.save()
+            element.save(update_fields=dirty)
 
             # Update the parent note's updated_at timestamp
-            if element.note:
-                element.note.save()
-            elif element.shared_note:
-                element.shared_note.save()
+            _touch_canvas_parent(element)
 
-            return JsonResponse({"success": True, "element": element.to_dict()})
+            return _element_response(element)
         except Exception as e:
             # Log the error for debugging but don't expose stack trace to user
-            import logging
-
-            logger = logging.getLogger(__name__)
             logger.error(f"Error updating canvas element: {str(e)}", exc_info=True)
             return JsonResponse({"success": False, "error": "Failed to update element"})
 
@@ -1676,31 +1929,20 @@ def canvas_element_update(request, element_id):
 def canvas_element_delete(request, element_id):
     """Delete a canvas element"""
     if request.method == "POST":
-        from .models import CanvasElement
-
         try:
-            element = get_object_or_404(CanvasElement, id=element_id)
+            element = _get_canvas_element(request.user, element_id)
 
             # Verify access
-            if element.note:
-                if element.note.user != request.user:
-                    return JsonResponse({"success": False, "error": "Access denied"})
-            elif element.shared_note:
-                if not element.shared_note.has_access(request.user):
-                    return JsonResponse({"success": False, "error": "Access denied"})
+            if not element.user_has_access:
+                return JsonResponse({"success": False, "error": "Access denied"})
 
             # Soft-delete: mark element as deleted so undo can restore it
-            from django.utils import timezone
-
             element.deleted = True
             element.deleted_at = timezone.now()
             element.save()
 
             # Update the parent note's updated_at timestamp
-            if element.note:
-                element.note.save()
-            elif element.shared_note:
-                element.shared_note.save()
+            _touch_canvas_parent(element)
 
             return JsonResponse({"success": True})
         except Http404:
@@ -1709,9 +1951,6 @@ def canvas_element_delete(request, element_id):
             return JsonResponse({"success": True, "error": "Element not found"})
         except Exception as e:
             # Log the error for debugging but don't expose stack trace to user
-            import logging
-
-            logger = logging.getLogger(__name__)
             logger.error(f"Error deleting canvas element: {str(e)}", exc_info=True)
             return JsonResponse({"success": False, "error": "Failed to delete element"})
 
@@ -1722,18 +1961,12 @@ def canvas_element_delete(request, element_id):
 def canvas_element_undelete(request, element_id):
     """Restore a soft-deleted canvas element (used by undo)"""
     if request.method == "POST":
-        from .models import CanvasElement
-
         try:
-            element = get_object_or_404(CanvasElement, id=element_id)
+            element = _get_canvas_element(request.user, element_id)
 
             # Verify access
-            if element.note:
-                if element.note.user != request.user:
-                    return JsonResponse({"success": False, "error": "Access denied"})
-            elif element.shared_note:
-                if not element.shared_note.has_access(request.user):
-                    return JsonResponse({"success": False, "error": "Access denied"})
+            if not element.user_has_access:
+                return JsonResponse({"success": False, "error": "Access denied"})
 
             # Only undelete if it was previously soft-deleted
             if not element.deleted:
@@ -1745,19 +1978,13 @@ def canvas_element_undelete(request, element_id):
             element.deleted_at = None
             element.save()
 
-            # Update parent note timestamp
-            if element.note:
-                element.note.save()
-            elif element.shared_note:
-                element.shared_note.save()
+            # Update the parent note's updated_at timestamp
+            _touch_canvas_parent(element)
 
-            return JsonResponse({"success": True, "element": element.to_dict()})
+            return _element_response(element)
         except Http404:
             return JsonResponse({"success": False, "error": "Element not found"})
         except Exception as e:
-            import logging
-
-            logger = logging.getLogger(__name__)
             logger.error(f"Error undeleting canvas element: {str(e)}", exc_info=True)
             return JsonResponse(
                 {"success": False, "error": "Failed to undelete element"}
@@ -1770,8 +1997,6 @@ def canvas_element_undelete(request, element_id):
 def canvas_element_upload_image(request):
     """Upload an image for a canvas element"""
     if request.method == "POST":
-        from .models import CanvasElement
-
         try:
             note_id = request.POST.get("note_id")
             shared_note_id = request.POST.get("shared_note_id")
@@ -1829,13 +2054,11 @@ def canvas_element_upload_image(request):
                 )
 
             element.save()
+            _touch_canvas_parent(element)
 
-            return JsonResponse({"success": True, "element": element.to_dict()})
+            return _element_response(element)
         except Exception as e:
             # Log the error for debugging but don't expose stack trace to user
-            import logging
-
-            logger = logging.getLogger(__name__)
             logger.error(f"Error uploading image: {str(e)}", exc_info=True)
             return JsonResponse({"success": False, "error": "Failed to upload image"})
 
@@ -24,6 +24,11 @@ class Settings(BaseSettings):
     db_password: str = Field(..., env="DB_PASSWORD", description="Database password")
     db_host: str = Field(..., env="DB_HOST", description="Database host")
     db_port: int = Field(5432, env="DB_PORT", description="Database port")
+    db_conn_max_age: int = Field(
+        600,
+        env="DB_CONN_MAX_AGE",
+        description="Seconds to keep a database connection open between requests",
+    )
 
     @field_validator("debug", mode="before")
     @classmethod
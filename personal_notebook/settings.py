@@ -89,6 +89,9 @@ DATABASES = {
         "PASSWORD": settings.db_password,
         "HOST": settings.db_host,
         "PORT": settings.db_port,
+        # Reuse connections across requests instead of reconnecting each time
+        "CONN_MAX_AGE": settings.db_conn_max_age,
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
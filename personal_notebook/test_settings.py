@@ -27,3 +27,31 @@ DEBUG = True
 SECURE_SSL_REDIRECT = False
 SESSION_COOKIE_SECURE = False
 CSRF_COOKIE_SECURE = False
+
+# Use a fast password hasher to speed up user creation in tests
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
+
+# Covering-index INCLUDE columns only apply on PostgreSQL
+SILENCED_SYSTEM_CHECKS = ['models.W040']
+
+# Object ids are reused between tests, so don't let cached per-user data leak
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }
+}
+
+
+class DisableMigrations:
+    """Build the test database straight from the models instead of replaying migrations"""
+
+    def __contains__(self, item):
+        return True
+
+    def __getitem__(self, item):
+        return None
+
+
+MIGRATION_MODULES = DisableMigrations()